@@ -1,6 +1,11 @@
 import sys
+import asyncio
+import tempfile
 from io import BytesIO
 import polars as pl
+import pyarrow as pa
+import pyarrow.ipc
+import pyarrow.parquet as pq
 import pandas as pd
 from pathlib import Path
 import panel as pn
@@ -26,6 +31,10 @@ CPI_CATEGORIES = ["Food", "Total"]
 BENCHMARK_CATEGORIES = ["Brent-Oil", "10-Year TY", "USD/EUR Spot", "Food Price Index", "ECB Food Commodity Index"]
 HEIGHT = 700
 CARD_WIDTH = 270
+EXPORT_FORMATS = {"CSV": ".csv", "Parquet": ".parquet", "Arrow IPC": ".arrow"}
+# Codecs a format applies itself; other compressions wrap the whole file
+EXPORT_NATIVE_CODECS = {"CSV": (), "Parquet": ("gzip", "zstd"), "Arrow IPC": ("zstd",)}
+EXPORT_CHUNK_ROWS = 50_000
 PLOT_COLORS = {
     ("Denmark", "Total"): "#78a3c5",        
     ("Denmark", "Food"): "#e6a96e",         
@@ -150,7 +159,7 @@ df = pl.concat([
     load_series("EXUSEU.csv", "Global (USD/EUR)", "USD/EUR Spot", need_adj=True),  
     load_fao_series("food_price_indices_data_jul25.csv", "Global (FAO)", "Food Price Index", need_adj=True),
     load_ecb_food_commodity_index("STS_M_I9_N_ECPE_CFOOD0_3_000.csv")
-])
+]).sort("date", maintain_order=True)  # date order lets plot_cpi binary search the range
 
 # --- Prepare UI values ---
 
@@ -189,115 +198,136 @@ change_mode = pn.widgets.RadioButtonGroup(
     
 )
 
+export_format = pn.widgets.RadioButtonGroup(
+    name="Format",
+    options=list(EXPORT_FORMATS),
+    button_type="primary",
+    value="CSV",
+    button_style='outline',
+)
+
+export_compression = pn.widgets.RadioButtonGroup(
+    name="Compression",
+    options=["None", "gzip", "zstd"],
+    button_type="primary",
+    value="None",
+    button_style='outline',
+)
+
 export_btn = pn.widgets.FileDownload(
-    label="Download Filtered CSV",
+    label="Download Filtered Data",
     filename="filtered_cpi.csv",
     file=True,
     button_type="success"
 )
 
+KPI_CARD = """
+<div style="background: {color}; border-radius: 6px; padding: 10px; text-align: center;">
+    <div style="font-size: 14px; font-weight: 600;">{label}</div>
+    <div style="font-size: 24px; font-weight: bold;">{display}</div>
+</div>
+"""
+# Cards are reused across updates; only their values change
+kpi_strip = pn.FlexBox(sizing_mode="stretch_width", gap="10px")
+kpi_cards = {}
+
+def kpi_frame(df: pl.DataFrame) -> pl.DataFrame:
+    # Latest value per series at the common latest date, plus Food-vs-Total gap per country
+    latest = (
+        df.lazy()
+        .filter(pl.col("date") == pl.col("date").max().over("category").min())
+        .group_by("country", "category")
+        .agg(pl.col("date").first(), pl.col("value").first())
+    )
+    gaps = (
+        latest
+        .group_by("country")
+        .agg(
+            pl.col("date").first(),
+            (
+                pl.col("value").filter(pl.col("category") == "Food").first()
+                - pl.col("value").filter(pl.col("category") == "Total").first()
+            ).alias("value"),
+        )
+        .drop_nulls("value")
+        .with_columns(pl.lit("Food vs Total").alias("category"))
+    )
+    return (
+        pl.concat([
+            latest.with_columns(pl.lit(False).alias("is_gap")),
+            gaps.with_columns(pl.lit(True).alias("is_gap")).select("country", "category", "date", "value", "is_gap"),
+        ])
+        .sort("country", "is_gap", "category")
+        .collect()
+    )
+
 def compute_kpis(df: pl.DataFrame, percent_mode: bool = False) -> pn.FlexBox:
     if df.is_empty():
         return pn.FlexBox(pn.pane.Markdown("⚠️ No data"))
 
-    df = (
-        df
-        .with_columns(
-            pl.col("date").max().over("category").alias('max_date')
-        )        
-    )
-    common_latest_date = df.get_column("max_date").min()
-    latest_df = df.filter(pl.col("date") == common_latest_date)
+    kpi_df = kpi_frame(df)
     cards = []
-    available_categories = latest_df.select("category").unique().to_series()
-    for country in sorted(latest_df.select("country").unique().to_series()):
-        values = {}
-        for category in available_categories:
-            subset = latest_df.filter(
-                (pl.col("country") == country) & (pl.col("category") == category)
-            )
-            if not subset.is_empty():
-                val = subset.select("value")[0, 0]
-                values[category] = val
-                color = PLOT_COLORS.get((country, category), "#ddd")
-
-                # Format based on % toggle
-                if percent_mode:
-                    display = f"{val:+.2%}"  
-                else:
-                    display = f"{val:.1f}" 
-
-                cards.append(pn.pane.HTML(
-                    f"""
-                    <div style="background: {color}; border-radius: 6px; padding: 10px; text-align: center;">
-                        <div style="font-size: 14px; font-weight: 600;">{country} – {category}</div>
-                        <div style="font-size: 24px; font-weight: bold;">{display}</div>
-                    </div>
-                    """,
-                    width=CARD_WIDTH, height=80
-                ))
-
-        # Add gap card if Food and Total both exist
-        if "Food" in values and "Total" in values:
-            diff = values["Food"] - values["Total"]
-            gap_color = "#c8e6c9" if diff >= 0 else "#ffcdd2"
-            gap_display = f"{diff:+.2%}" if percent_mode else f"{diff:+.2f}"
-            cards.append(pn.pane.HTML(
-                f"""
-                <div style="background: {gap_color}; border-radius: 6px; padding: 10px; text-align: center;">
-                    <div style="font-size: 14px; font-weight: 600;">{country} – Food vs Total</div>
-                    <div style="font-size: 24px; font-weight: bold;">{gap_display}</div>
-                </div>
-                """,
-                width=CARD_WIDTH, height=80
-            ))
-
-    cards.append(pn.pane.Markdown(f"📅 Latest: **{common_latest_date}**", width=200))
-    return pn.FlexBox(*cards, sizing_mode="stretch_width", gap="10px")
+    for country, category, _, val, is_gap in kpi_df.iter_rows():
+        label = f"{country} – {category}"
+        if is_gap:
+            color = "#c8e6c9" if val >= 0 else "#ffcdd2"
+            display = f"{val:+.2%}" if percent_mode else f"{val:+.2f}"
+        else:
+            color = PLOT_COLORS.get((country, category), "#ddd")
+            # Format based on % toggle
+            display = f"{val:+.2%}" if percent_mode else f"{val:.1f}"
+        card = kpi_cards.get(label)
+        if card is None:
+            card = kpi_cards[label] = pn.pane.HTML(width=CARD_WIDTH, height=80)
+        card.object = KPI_CARD.format(color=color, label=label, display=display)
+        cards.append(card)
+
+    if "latest" not in kpi_cards:
+        kpi_cards["latest"] = pn.pane.Markdown(width=200)
+    kpi_cards["latest"].object = f"📅 Latest: **{kpi_df.get_column('date').min()}**"
+    cards.append(kpi_cards["latest"])
+
+    if len(kpi_strip.objects) != len(cards) or any(a is not b for a, b in zip(kpi_strip.objects, cards)):
+        kpi_strip.objects = cards
+    return kpi_strip
 
 # --- Callback Logic ---
 @pn.depends(country_selector, cpi_selector, benchmark_selector, date_slider, change_mode)
 def plot_cpi(country, food_cats, benchmark_cats, date_range, mode):
     # Build valid country-category combinations
-    selected_pairs = [(c, cat) for c in country for cat in food_cats] + [
-        (c, cat) for (c, cat) in PLOT_COLORS if cat in benchmark_cats
-    ]
-
-    # Now filter using tuple column logic
-    raw_filtered = (
-        df.with_columns(
-            (pl.col("country") + "||" + pl.col("category")).alias("pair_key")
-        )
-        .filter(
-            pl.col("pair_key").is_in([
-                f"{c}||{cat}" for (c, cat) in selected_pairs
-            ]) &
-            (pl.col("date") >= date_range[0]) &
-            (pl.col("date") <= date_range[1])
-        )
-        .drop("pair_key")
-        .sort("date")
-    )
-    if raw_filtered.is_empty():
-        return pn.pane.Markdown("### ⚠️ No data for current filter.")
-
-    # Apply window-based % change if needed
+    selected_pairs = pl.DataFrame(
+        [(c, cat) for c in country for cat in food_cats] + [
+            (c, cat) for (c, cat) in PLOT_COLORS if cat in benchmark_cats
+        ],
+        schema={"country": pl.String, "category": pl.String},
+        orient="row",
+    ).to_struct("pair")
+
+    # df is date-sorted, so the date range is a slice found by binary search
+    start = df.get_column("date").search_sorted(date_range[0], side="left")
+    end = df.get_column("date").search_sorted(date_range[1], side="right")
+
+    # Window-based % change if needed, computed in the same lazy plan
     if mode == "MoM %":
-        display_df = raw_filtered.with_columns(
-            pl.col("value").pct_change().over(["country", "category"]).alias("value")
-        )
+        value = pl.col("value").pct_change()
         ylabel = "% change (MoM)"
     elif mode == "YoY %":
-        display_df = raw_filtered.with_columns(
-            (
-                pl.col("value") / pl.col("value").shift(12) - 1
-            ).over(["country", "category"]).alias("value")
-        )
+        value = pl.col("value") / pl.col("value").shift(12) - 1
         ylabel = "% change (YoY)"
     else:
-        display_df = raw_filtered
+        value = pl.col("value")
         ylabel = "Index (2015 = 100)"
 
+    display_df = (
+        df.slice(start, end - start)
+        .lazy()
+        .filter(pl.struct("country", "category").is_in(selected_pairs.implode()))
+        .with_columns(value.over(["country", "category"]).alias("value"))
+        .collect()
+    )
+    if display_df.is_empty():
+        return pn.pane.Markdown("### ⚠️ No data for current filter.")
+
     display_df = (
         display_df
         .with_columns(
@@ -310,10 +340,14 @@ def plot_cpi(country, food_cats, benchmark_cats, date_range, mode):
     }
    
     curves = []
-    for key, group in display_df.to_pandas().groupby("group_key"):
+    series = display_df.partition_by("group_key", as_dict=True, include_key=False)
+    for (key,), group in sorted(series.items()):
         
         curve = hv.Curve(
-            group,
+            {
+                "date": group["date"].cast(pl.Datetime("ms")).to_numpy(),
+                "value": group["value"].to_numpy(),
+            },
             kdims=["date"],
             vdims=["value"],
             label=key
@@ -339,9 +373,10 @@ def plot_cpi(country, food_cats, benchmark_cats, date_range, mode):
         responsive=True,
         show_grid=True
     )
-    # Convert just for Tabulator (Panel doesn't support Polars in tables yet)
+    # Tabulator needs pandas (Panel doesn't support Polars in tables yet);
+    # Arrow-backed columns share the Polars buffers instead of copying them
     table = pn.widgets.Tabulator(
-        display_df.to_pandas(),
+        display_df.to_pandas(use_pyarrow_extension_array=True),
         pagination="remote", page_size=20, layout="fit_data_fill", height=int(HEIGHT/2)
     )
     pn.state.cache['data'] = display_df.clone()
@@ -351,7 +386,59 @@ def plot_cpi(country, food_cats, benchmark_cats, date_range, mode):
     return pn.Column(kpis, chart, "### 📋 Filtered Data", table)
 
 
-def download_callback():
+class _Drain:
+    """Write-only file collecting encoded bytes until export_chunks hands them out."""
+    closed = False
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self.parts)
+        self.parts.clear()
+        return data
+
+
+def export_chunks(df: pl.DataFrame, fmt: str, compression: str):
+    """Encode df one slice of rows at a time, yielding the bytes of each slice.
+
+    Parquet and Arrow IPC use their own codec where they have one (a row
+    group / record batch per slice); otherwise gzip/zstd wrap the stream.
+    """
+    native = compression if compression in EXPORT_NATIVE_CODECS[fmt] else None
+    wrapped = compression if compression != "None" and native is None else None
+    drain = _Drain()
+    sink = pa.PythonFile(drain, mode="w")
+    stream = pa.CompressedOutputStream(sink, wrapped) if wrapped else sink
+    writer = None
+    for i, chunk in enumerate(df.iter_slices(EXPORT_CHUNK_ROWS)):
+        if fmt == "CSV":
+            stream.write(chunk.write_csv(include_header=i == 0).encode("utf-8"))
+        else:
+            table = chunk.to_arrow()
+            if writer is None and fmt == "Parquet":
+                writer = pq.ParquetWriter(stream, table.schema, compression=native or "none")
+            elif writer is None:
+                writer = pa.ipc.new_file(stream, table.schema, options=pa.ipc.IpcWriteOptions(compression=native))
+            writer.write_table(table)
+        yield drain.drain()
+    if writer is not None:
+        writer.close()
+    stream.close()
+    yield drain.drain()
+
+
+async def download_callback():
     df_cached = pn.state.cache.get("data")
     if df_cached is None or df_cached.is_empty():
         return BytesIO(b"No data")
@@ -364,11 +451,21 @@ def download_callback():
         "MoM %": "mom",
         "YoY %": "yoy"
     }[change_mode.value]
-    export_btn.filename = f"cpi_{countries}_{suffix}_{date_range}.csv"
-    csv_bytes = df_cached.write_csv().encode("utf-8")
-    buf = BytesIO(csv_bytes)
-    buf.seek(0)
-    return buf
+    fmt, compression = export_format.value, export_compression.value
+    extension = EXPORT_FORMATS[fmt]
+    if compression != "None" and compression not in EXPORT_NATIVE_CODECS[fmt]:
+        extension += {"gzip": ".gz", "zstd": ".zst"}[compression]
+    export_btn.filename = f"cpi_{countries}_{suffix}_{date_range}{extension}"
+
+    def spool():
+        # Encoded off the event loop into a temporary file, one slice at a time
+        fh = tempfile.TemporaryFile()
+        for chunk in export_chunks(df_cached, fmt, compression):
+            fh.write(chunk)
+        fh.seek(0)
+        return fh
+
+    return await asyncio.to_thread(spool)
 
 export_btn.callback = download_callback
 
@@ -407,6 +504,8 @@ dashboard = pn.template.FastListTemplate(
         change_mode,
 
         pn.layout.Divider(),
+        export_format,
+        export_compression,
         export_btn
     ),
     main=[plot_cpi]
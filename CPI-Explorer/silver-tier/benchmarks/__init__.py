@@ -0,0 +1 @@
+"""Synthetic-data benchmarks for the dashboard hot paths; run with ``python -m benchmarks``."""
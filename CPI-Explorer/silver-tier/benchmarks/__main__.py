@@ -0,0 +1,223 @@
+"""Benchmark suite for the CPI Explorer hot paths.
+
+Run from the silver-tier folder:
+
+    python -m benchmarks                          # every scenario, printed as a table
+    python -m benchmarks -s wide -s daily -r 10   # selected scenarios, 10 runs each
+    python -m benchmarks -o bench.json            # also write the results as JSON
+    python -m benchmarks -b bench.json            # compare against a stored run
+
+With ``--baseline`` the exit code is 1 when any case got slower than the
+baseline median by more than ``--tolerance``.
+"""
+import argparse
+import datetime as dt
+import gc
+import json
+import logging
+import platform
+import statistics
+import sys
+from contextlib import contextmanager
+from time import perf_counter
+
+import panel as pn
+import param
+import polars as pl
+from bokeh.document import Document
+from panel.io.state import set_curdoc
+
+import main as app
+from src import *
+from src.catalog import series_catalog
+from src.data_loader import _data_merger, load_initial_data
+from src.plotter import _compute_kpis, plot_cpi
+from src.session import _end_session
+
+from .synthetic import SCENARIOS, synthetic_settings, synthetic_sources
+
+logger = logging.getLogger("app_logger")
+
+# Differences below this many seconds are treated as noise when comparing
+NOISE_FLOOR = 0.001
+
+
+def _timeit(func, repeat: int, setup=None) -> dict:
+    """Time ``func`` ``repeat`` times, running the untimed ``setup`` before each call."""
+    runs = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            start = perf_counter()
+            func()
+            runs.append(perf_counter() - start)
+        finally:
+            if gc_enabled:
+                gc.enable()
+    return {
+        "min": min(runs),
+        "median": statistics.median(runs),
+        "mean": statistics.fmean(runs),
+        "runs": runs,
+    }
+
+
+@contextmanager
+def _offline_fred():
+    """Refuse FRED connections at once, so loads time the mirror and series store path, not the network."""
+    overrides = {"FRED_BASE_URL": "http://127.0.0.1:9/fredgraph.csv?id=", "FRED_RETRIES": 0}
+    previous = {name: getattr(Settings, name) for name in overrides}
+    for name, value in overrides.items():
+        setattr(Settings, name, value)
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            setattr(Settings, name, value)
+
+
+def _release_slider(slider, value):
+    """What the browser sends when the user lets go of the date slider."""
+    slider.value = value
+    with param.edit_constant(slider):
+        slider.value_throttled = value
+
+
+def _round_trips(widgets, date_range, repeat: int) -> dict:
+    start, end = date_range
+    ranges = [(start, end), (start + dt.timedelta(days=366), end)]
+    modes = ["YoY %", "MoM %"]
+    runs = iter(range(10 ** 9))
+
+    def slider():
+        _release_slider(widgets.date_slider, ranges[next(runs) % 2])
+
+    def mode():
+        widgets.change_mode.value = modes[next(runs) % 2]
+
+    return {
+        "round_trip_date_slider": _timeit(slider, repeat, setup=results_cache.clear),
+        "round_trip_change_mode": _timeit(mode, repeat, setup=results_cache.clear),
+    }
+
+
+def run_scenario(countries: int, benchmarks: int, years: int, frequency: str, repeat: int) -> dict:
+    """Time every hot path against one synthetic dataset."""
+    timings = {}
+    with synthetic_settings(countries, benchmarks, frequency):
+        sources = synthetic_sources(countries, benchmarks, years, frequency)
+        timings["_data_merger"] = _timeit(_data_merger, repeat, setup=lambda: pn.state.cache.update(sources))
+
+        doc = Document()
+        with set_curdoc(doc):
+            app.create_app()
+            on_load_trigger()
+            state = session_state()
+            data = state.data
+            catalog = series_catalog()
+            country, cpi, bench = catalog.countries[0], catalog.cpi_categories, data["categories"]
+            date_range = (data["min_date"], data["max_date"])
+            mode = "YoY %"
+
+            correlation_df = calc_correlations(date_range)
+            selection = transform_selection(country, cpi, bench, date_range, mode)
+            cases = {
+                "calc_correlations": lambda: calc_correlations(date_range),
+                "calc_min_max_correlations": lambda: calc_min_max_correlations(correlation_df, country, cpi, mode),
+                "calc_lag_correlations": lambda: calc_lag_correlations(date_range),
+                "selection_lag_correlations": lambda: selection_lag_correlations(country, cpi, date_range, mode),
+                "compute_rolling_correlation": lambda: compute_rolling_correlation(selection, cpi, country, bench),
+                "plot_cpi": lambda: plot_cpi(country, cpi, bench, date_range, mode),
+                "_compute_kpis": lambda: _compute_kpis(selection, percent_mode=True),
+            }
+            for name, func in cases.items():
+                # Cold runs: the memo cache would otherwise answer every repeat
+                timings[name] = _timeit(func, repeat, setup=results_cache.clear)
+            timings.update(_round_trips(state.widgets, date_range, repeat))
+        _end_session(id(doc))
+    return {
+        "params": {"countries": countries, "benchmarks": benchmarks, "years": years, "frequency": frequency},
+        "rows": sum(len(df) for df in sources.values()),
+        "timings": timings,
+    }
+
+
+def run(scenarios: list, repeat: int) -> dict:
+    with _offline_fred():
+        bundled = _timeit(load_initial_data, repeat)
+    results = {
+        "bundled": {
+            "params": {"source": "mirrored downloads and data files"},
+            "timings": {"load_initial_data": bundled},
+        }
+    }
+    for name in scenarios:
+        logger.info(f"Running scenario {name}")
+        results[name] = run_scenario(*SCENARIOS[name], repeat=repeat)
+    return {
+        "meta": {
+            "created": dt.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "polars": pl.__version__,
+            "panel": pn.__version__,
+            "repeat": repeat,
+        },
+        "results": results,
+    }
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list:
+    """Cases whose median regressed by more than ``tolerance`` against the baseline."""
+    regressions = []
+    for scenario, result in report["results"].items():
+        base_timings = baseline.get("results", {}).get(scenario, {}).get("timings", {})
+        for case, timing in result["timings"].items():
+            if case not in base_timings:
+                continue
+            before, after = base_timings[case]["median"], timing["median"]
+            timing["baseline_median"] = before
+            timing["ratio"] = after / before if before else None
+            if after - before > NOISE_FLOOR and after > before * (1 + tolerance):
+                regressions.append((scenario, case, before, after))
+    return regressions
+
+
+def _print_table(report: dict):
+    print(f"{'scenario':<10} {'case':<30} {'median ms':>10} {'min ms':>10} {'vs base':>8}")
+    for scenario, result in report["results"].items():
+        for case, timing in result["timings"].items():
+            ratio = f"{timing['ratio']:.2f}x" if timing.get("ratio") else ""
+            print(f"{scenario:<10} {case:<30} {timing['median'] * 1e3:>10.2f} {timing['min'] * 1e3:>10.2f} {ratio:>8}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__.splitlines()[0])
+    parser.add_argument("-s", "--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="scenario to run, may be repeated (default: all)")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="timed runs per case")
+    parser.add_argument("-o", "--output", help="write the results as JSON to this file")
+    parser.add_argument("-b", "--baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument("-t", "--tolerance", type=float, default=0.2,
+                        help="allowed slowdown over the baseline median, as a fraction")
+    args = parser.parse_args(argv)
+
+    report = run(args.scenario or list(SCENARIOS), args.repeat)
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as fh:
+            regressions = compare(report, json.load(fh), args.tolerance)
+    _print_table(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+    for scenario, case, before, after in regressions:
+        print(f"REGRESSION {scenario}/{case}: {before * 1e3:.2f} ms -> {after * 1e3:.2f} ms", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+import datetime as dt
+from contextlib import contextmanager
+
+import numpy as np
+import polars as pl
+
+from src.alignment import FREQUENCIES
+from src.catalog import SeriesCatalog, use_catalog
+from src.config import Settings
+
+__all__ = ["FREQUENCIES", "SCENARIOS", "synthetic_catalog", "synthetic_sources", "synthetic_settings"]
+
+# name -> (countries, benchmarks, years of history, frequency)
+SCENARIOS = {
+    "baseline": (2, 5, 30, "monthly"),
+    "wide": (10, 20, 30, "monthly"),
+    "long": (2, 5, 60, "monthly"),
+    "weekly": (4, 10, 30, "weekly"),
+    "daily": (2, 5, 30, "daily"),
+}
+
+END_DATE = dt.date(2025, 6, 1)
+CPI_CATEGORIES = ["Food", "Total"]
+
+
+def _names(countries: int, benchmarks: int):
+    country_names = [f"Country {i:02d}" for i in range(countries)]
+    benchmark_pairs = [(f"Global (B{i:02d})", f"Benchmark {i:02d}") for i in range(benchmarks)]
+    return country_names, benchmark_pairs
+
+
+def _walk(rng: np.random.Generator, n: int) -> np.ndarray:
+    """Index-like random walk rebased so it hovers around 100."""
+    return 100 * np.exp(np.cumsum(rng.normal(0.002, 0.01, n)))
+
+
+def synthetic_catalog(countries: int, benchmarks: int, frequency: str = "monthly") -> SeriesCatalog:
+    country_names, benchmark_pairs = _names(countries, benchmarks)
+    rows = [
+        *(("cpi", country, category, "#78a3c5") for country in country_names for category in CPI_CATEGORIES),
+        *(("benchmark", country, category, "#9b7b74") for country, category in benchmark_pairs),
+    ]
+    return SeriesCatalog(pl.DataFrame(
+        [(f"S{i:04d}", kind, country, category, "generic", frequency, color) for i, (kind, country, category, color) in enumerate(rows)],
+        schema=["id", "kind", "country", "category", "adapter", "frequency", "color"],
+        orient="row",
+    ))
+
+
+@contextmanager
+def synthetic_settings(countries: int, benchmarks: int, frequency: str = "monthly"):
+    """Point the catalog and Settings at the synthetic universe for the duration of a run."""
+    overrides = {
+        # Time the live computations; standard windows would otherwise be cube lookups
+        "CORRELATION_CUBE": False,
+        # Run the engine at the scenario's own frequency rather than resampled to monthly
+        "ANALYSIS_FREQUENCY": frequency,
+    }
+    previous = {name: getattr(Settings, name) for name in overrides}
+    for name, value in overrides.items():
+        setattr(Settings, name, value)
+    previous_catalog = use_catalog(synthetic_catalog(countries, benchmarks, frequency))
+    try:
+        yield
+    finally:
+        use_catalog(previous_catalog)
+        for name, value in previous.items():
+            setattr(Settings, name, value)
+
+
+def synthetic_sources(countries: int, benchmarks: int, years: int, frequency: str = "monthly", seed: int = 0) -> dict:
+    """Source frames keyed the way `load_initial_data` stages them in pn.state.cache.
+
+    CPI series are keyed ``<country>_<category>``, benchmarks by their
+    category; every frame has the ``date, country, category, value`` schema
+    of the preprocessed downloads.
+    """
+    rng = np.random.default_rng(seed)
+    dates = pl.date_range(
+        END_DATE.replace(year=END_DATE.year - years), END_DATE, FREQUENCIES[frequency], eager=True
+    )
+    country_names, benchmark_pairs = _names(countries, benchmarks)
+    series = {
+        **{f"{country}_{category}": (country, category) for country in country_names for category in CPI_CATEGORIES},
+        **{category: (country, category) for country, category in benchmark_pairs},
+    }
+    return {
+        key: pl.DataFrame({
+            "date": dates,
+            "country": pl.repeat(country, len(dates), eager=True),
+            "category": pl.repeat(category, len(dates), eager=True),
+            "value": _walk(rng, len(dates)),
+        })
+        for key, (country, category) in series.items()
+    }
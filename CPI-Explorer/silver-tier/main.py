@@ -9,28 +9,83 @@ pn.extension(
     notifications=True,
     ready_notification='Application fully loaded.',
 )
-pn.config.throttled = True
 pn.state.notifications.position = "bottom-right"
 
 from src import *
 
 logger = logging.getLogger("app_logger")
 
-def main(port):      
+def _start_session(sidebar):
+    # Widgets need the categories and date range, so they are built once data is there
+    state = session_state()
+    state.attach()
+    state.widgets = create_widgets(state.data)
+    bind_widgets(state.widgets)
+    sidebar.objects = create_sidebar().objects
+    if Settings.REFRESH_PERIOD and pn.state.curdoc.session_context is not None:
+        # Picks up snapshots published by the scheduled refresh
+        pn.state.add_periodic_callback(follow_data_updates, period=Settings.SNAPSHOT_POLL_MS)
+
+def _wait_for_data(sidebar):
+    """Poll until the background load publishes the data, then start the session."""
+    # The page's own ready notification would fire before the data is in
+    notifications = pn.state.notifications
+    if notifications is not None:
+        notifications.js_events = {k: v for k, v in notifications.js_events.items() if k != "document_ready"}
+
+    def poll():
+        if shared_data.current is None and loading_status["state"] != "failed":
+            return
+        callback.stop()
+        if shared_data.current is None:
+            sidebar.objects = [pn.pane.Alert("Data could not be loaded.", alert_type="danger")]
+            for msg in loading_status["errors"]:
+                pn.state.notifications.error(msg)
+            return
+        _start_session(sidebar)
+        on_load_trigger()
+        if pn.config.ready_notification:
+            pn.state.notifications.success(pn.config.ready_notification, duration=3000)
 
+    callback = pn.state.add_periodic_callback(poll, period=Settings.READY_POLL_MS)
+
+def create_app():
+    # Built once per browser session so widgets and results are not shared
+    sidebar = pn.Column()
     dashboard = create_dashboard(
-        sidebar_layout=create_sidebar(),
+        sidebar_layout=sidebar,
         main_layout=[],
         title='CPI Explorer Dashboard Silver Tier'
     )  
 
-    pn.state.onload(on_load_trigger)      
+    if shared_data.current is not None:
+        _start_session(sidebar)
+        pn.state.onload(on_load_trigger)
+    else:
+        sidebar.objects = [
+            pn.indicators.LoadingSpinner(value=True, width=25, height=25),
+            pn.pane.Markdown("Loading data..."),
+        ]
+        _wait_for_data(sidebar)
+    return dashboard
+
+def main(port):      
+    if Settings.DEFERRED_LOADING:
+        load_in_background()
+    else:
+        load_initial_data()
+    schedule_refresh()
 
     pn.serve(        
-        dashboard,
+        create_app,
         port=port,
         autoreload=False,
-        show=True
+        show=True,
+        extra_patterns=[
+            (Settings.METRICS_ROUTE, MetricsHandler),
+            (Settings.HEALTH_ROUTE, HealthHandler),
+            (Settings.EXPORT_ROUTE, ExportHandler),
+        ],
     )    
 
 if __name__ == '__main__':
@@ -7,11 +7,21 @@ from .dashboards_factory import *
 from .config import *
 from .utils import *
 from .data_processor import *
+from .corr_engine import *
+from .correlation_cube import *
 from .card_manager import *
+from .session import *
+from .memo import *
+from .instrumentation import *
+from .tasks import *
+from .export import *
+from .sources import *
+from .alignment import *
 
 __all__ = (
     logger.__all__ + widgets.__all__ + dashboards_factory.__all__ + card_manager.__all__ +
-    config.__all__ + data_loader.__all__ + utils.__all__ + data_processor.__all__ +
-    plotter.__all__
+    config.__all__ + data_loader.__all__ + utils.__all__ + data_processor.__all__ + corr_engine.__all__ + correlation_cube.__all__ +
+    plotter.__all__ + bindings.__all__ + session.__all__ +
+    memo.__all__ + instrumentation.__all__ + tasks.__all__ + export.__all__ + sources.__all__ + alignment.__all__
 )
 
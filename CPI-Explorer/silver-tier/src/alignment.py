@@ -0,0 +1,73 @@
+import re
+
+import polars as pl
+
+from .config import Settings
+
+__all__ = ["resample"]
+
+# Frequency name -> group_by_dynamic period, finest first
+FREQUENCIES = {"daily": "1d", "weekly": "1w", "monthly": "1mo", "quarterly": "1q", "annual": "1y"}
+PERIODS_PER_YEAR = {"daily": 365, "weekly": 52, "monthly": 12, "quarterly": 4, "annual": 1}
+PERIOD_NAMES = {"daily": "days", "weekly": "weeks", "monthly": "months", "quarterly": "quarters", "annual": "years"}
+_AGGREGATIONS = {"mean": pl.Expr.mean, "median": pl.Expr.median, "last": pl.Expr.last}
+
+
+def periods_per_year(frequency: str = None) -> int:
+    """Observations per year at the analysis frequency, the lag of the YoY mode."""
+    return PERIODS_PER_YEAR[frequency or Settings.ANALYSIS_FREQUENCY]
+
+
+def months_to_periods(months: int, frequency: str = None) -> int:
+    """A span of months as the nearest whole number of periods of the given frequency."""
+    return round(months * periods_per_year(frequency) / 12)
+
+
+def period_start(date, frequency: str = None):
+    """Start of the period of the given frequency that holds date."""
+    every = FREQUENCIES[frequency or Settings.ANALYSIS_FREQUENCY]
+    return pl.Series([date]).dt.truncate(every)[0]
+
+
+def shift_periods(date, periods: int, frequency: str = None):
+    """date moved by a number of periods of the given frequency."""
+    number, unit = re.fullmatch(r"(\d+)(\D+)", FREQUENCIES[frequency or Settings.ANALYSIS_FREQUENCY]).groups()
+    return pl.Series([date]).dt.offset_by(f"{periods * int(number)}{unit}")[0]
+
+
+def date_grid(first, last, pad: int = 0, frequency: str = None) -> pl.Series:
+    """Every period start from first to last, extended by pad periods on both sides."""
+    frequency = frequency or Settings.ANALYSIS_FREQUENCY
+    return pl.date_range(
+        shift_periods(first, -pad, frequency), shift_periods(last, pad, frequency), FREQUENCIES[frequency], eager=True
+    )
+
+
+def resample(df: pl.DataFrame, frequency: str) -> pl.DataFrame:
+    """A compact frame with every series at one row per period of frequency.
+
+    Observations are aggregated with Settings.RESAMPLE_AGGREGATION and dated
+    at the start of their period, the way the monthly files are, so daily,
+    weekly and monthly series meet on the same dates. A series coarser than
+    frequency, or with missing periods, carries its last value forward to
+    every period up to its last observation: the change modes shift by a
+    number of rows, which is only a fixed span of time with one row per period.
+    """
+    every = FREQUENCIES[frequency]
+    series = ["country", "category"]
+    periods = (
+        df.group_by_dynamic("date", every=every, group_by=series, label="left")
+        .agg(_AGGREGATIONS[Settings.RESAMPLE_AGGREGATION](pl.col("value")))
+    )
+    grid = (
+        periods.group_by(series)
+        .agg(pl.col("date").min().alias("first"), pl.col("date").max().alias("last"))
+        .select(*series, pl.date_ranges("first", "last", every).alias("date"))
+        .explode("date")
+    )
+    return (
+        grid.join(periods, on=[*series, "date"], how="left")
+        .sort(*series, "date")
+        .with_columns(pl.col("value").forward_fill().over(series))
+        .select(df.columns)
+    )
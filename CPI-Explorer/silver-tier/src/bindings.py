@@ -1,33 +1,29 @@
 import panel as pn
-from .widgets import *
 from .plotter import *
 from .utils import *
 
+__all__ = ["bind_widgets"]
 
-date_slider.param.watch(correlations_calculations,'value')
-corr_strength.param.watch(min_max_corr_handler, 'value')
-corr_type_selector.param.watch(type_corr_handler, 'value')
-file_download.callback = download_callback
+def bind_widgets(w):
+    """Wire one session's widgets to its handlers and plotters."""
+    # Slider and selection callbacks are latest-wins tasks, see src/tasks.py
+    w.date_slider.param.watch(slider_drag_handler,'value')
+    w.date_presets.on_click(date_preset_handler)
+    w.corr_strength.param.watch(min_max_corr_handler, 'value')
+    w.corr_type_selector.param.watch(type_corr_handler, 'value')
+    w.download_selector.param.watch(download_callback, 'value')
+    w.export_format.param.watch(download_callback, 'value')
+    w.export_compression.param.watch(download_callback, 'value')
+    download_callback()
 
 
-# Bind the CPI plot handler
-cpi_hndl = pn.bind(
-    first_tab_plotter,
-    country=country_selector,
-    cpi=cpi_selector,
-    benchmarks=benchmark_selector,
-    date_range=date_slider,
-    mode=change_mode,
-    watch=True
-)
-
-# Bind the correlation matrix plot handler
-coor_hndl = pn.bind(
-    second_tab_plotter,
-    country=country_selector,
-    cpi=cpi_selector,
-    benchmarks=benchmark_selector,
-    date_range=date_slider,
-    mode=change_mode,
-    watch=True
-)
\ No newline at end of file
+    # Redraw both tabs for each settled selection
+    pn.bind(
+        refresh_tabs,
+        country=w.country_selector,
+        cpi=w.cpi_selector,
+        benchmarks=w.benchmark_selector,
+        date_range=w.date_slider.param.value_throttled,
+        mode=w.change_mode,
+        watch=True
+    )
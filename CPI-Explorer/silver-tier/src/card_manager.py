@@ -1,59 +1,70 @@
-from collections import defaultdict
 import panel as pn
 
 from .config import Settings
+from .session import session_state
 
 __all__ = ['create_layout','add_card']
 
-cards = pn.state.cache['cards'] = {}
-update_trigger = pn.state.cache['update_trigger'] = pn.widgets.Button(name='Update', button_type='primary', visible=False)
 
+def _patch(current, new) -> bool:
+    """Morph current into new in place where their structure matches."""
+    if isinstance(current, pn.pane.PaneBase):
+        if isinstance(new, pn.pane.PaneBase):
+            if type(new) is not type(current):
+                return False
+            new = new.object
+        elif isinstance(new, pn.viewable.Viewable) or not type(current).applies(new):
+            return False
+        if current.object is not new:
+            current.object = new
+        return True
+    if (
+        isinstance(current, pn.layout.ListLike)
+        and type(current) is type(new)
+        and len(current) == len(new)
+    ):
+        return all(_patch(old, child) for old, child in zip(current.objects, new.objects))
+    return False
 
-def add_card(content, tab, slot, need_update=False, need_clear=False, title="New Card",collapsed=False):
-    
-    new_card = pn.Card(
-        content,
-        title=title,
-        collapsed=collapsed,           
-    )    
-    if need_clear:
-        cards.clear()    
-    cards[tab, slot]=new_card
-    if need_update:
-        update_trigger.clicks += 1
-
-
-@pn.depends(update_trigger.param.clicks)
-def create_layout(*args):
-    """Create a layout containing all current cards, grouped into tabs."""
-    if not pn.state.cache['cards'].keys():
-        return
-    
-    tab_cards = defaultdict(list)
-    sorted_keys = sorted(cards.keys(), key=lambda x: x[1])
-    for (tab_index, _), card in ((key, cards[key]) for key in sorted_keys):
-        tab_cards[tab_index].append(card)
 
-    tab_0_cards = tab_cards[0]
-    tab_1_cards = tab_cards[1]
-    
+def _swap_content(card, content):
+    """Update a card's body in place, replacing it only when the layout changed."""
+    current = card.objects[0] if card.objects else None
+    if current is None or not _patch(current, content):
+        card.objects = [pn.panel(content)]
 
-    tab_list = []
-    for tab_index in sorted(tab_cards.keys()):
-        title = Settings.TAB_NAMES.get(tab_index, f"Tab {tab_index}")
-        tab_list.append((title, pn.Column(*tab_cards[tab_index])))
 
-    new_tabs = pn.Tabs(*tab_list)
+def _tab_column(state, tab):
+    """Column backing a tab, created and inserted in tab order on first use."""
+    if tab not in state.tab_columns:
+        column = state.tab_columns[tab] = pn.Column()
+        title = Settings.TAB_NAMES.get(tab, f"Tab {tab}")
+        position = sorted(state.tab_columns).index(tab)
+        state.tabs.insert(position, (title, column))
+    return state.tab_columns[tab]
 
-    # Restore previously selected tab
-    last_index = pn.state.cache.get("selected_tab_index", 0)
-    new_tabs.active = last_index
 
-    # Watch for tab change to persist selected tab index
-    def update_selected_index(event):
-        pn.state.cache["selected_tab_index"] = event.new
-
-    new_tabs.param.watch(update_selected_index, "active")
+def add_card(content, tab, slot, need_clear=False, title="New Card",collapsed=False):
+    """Show content in the (tab, slot) card, creating the card only once."""
+    state = session_state()
+    if need_clear:
+        state.cards.clear()
+        state.tab_columns.clear()
+        state.tabs.clear()
+    card = state.cards.get((tab, slot))
+    if card is not None:
+        card.title = title
+        _swap_content(card, content)
+        return
+    card = state.cards[tab, slot] = pn.Card(
+        pn.panel(content),
+        title=title,
+        collapsed=collapsed,           
+    )    
+    column = _tab_column(state, tab)
+    column.objects = [state.cards[key] for key in sorted(k for k in state.cards if k[0] == tab)]
 
-    return new_tabs
 
+def create_layout():
+    """The session's tabs; cards are added and updated in place by add_card."""
+    return session_state().tabs
@@ -0,0 +1,120 @@
+import logging
+from pathlib import Path
+
+import polars as pl
+
+from .config import Settings
+
+logger = logging.getLogger("app_logger")
+
+__all__ = ["series_catalog"]
+
+_SCHEMA = {
+    "id": pl.String,
+    "kind": pl.String,
+    "country": pl.String,
+    "category": pl.String,
+    "adapter": pl.String,
+    "series_id": pl.String,
+    "file": pl.String,
+    "frequency": pl.String,
+    "color": pl.String,
+    "base_year": pl.Int64,
+}
+KINDS = ("cpi", "benchmark")
+# Catalog columns that describe the series rather than how to load it
+_DISPLAY_COLUMNS = ("id", "kind", "frequency", "color")
+
+_active = None
+
+
+class SeriesCatalog:
+    """Every series the app knows, with the lookups the app needs precomputed.
+
+    A series is identified by its id or by its (country, category) pair, the
+    key of the series index into full_raw_data. The file order of the rows
+    sets the order of countries, categories and series everywhere.
+    """
+
+    def __init__(self, frame: pl.DataFrame):
+        unknown = set(frame.get_column("kind").unique().to_list()) - set(KINDS)
+        if unknown:
+            raise ValueError(f"Unknown series kinds in the catalog: {sorted(unknown)}")
+        for column in ("id", ["country", "category"]):
+            if frame.select(column).is_duplicated().any():
+                raise ValueError(f"Duplicate {column} in the catalog")
+        self.frame = frame
+        rows = frame.to_dicts()
+        cpi = [row for row in rows if row["kind"] == "cpi"]
+
+        self.by_id = {row["id"]: row for row in rows}
+        self.by_pair = {(row["country"], row["category"]): row for row in rows}
+        self.countries = list(dict.fromkeys(row["country"] for row in cpi))
+        self.cpi_categories = list(dict.fromkeys(row["category"] for row in cpi))
+        self.benchmark_categories = list(dict.fromkeys(row["category"] for row in rows if row["kind"] == "benchmark"))
+        self.all_countries = list(dict.fromkeys(row["country"] for row in rows))
+        self.all_categories = list(dict.fromkeys(row["category"] for row in rows))
+
+        # Country-major, the row order of every correlation table
+        self.cpi_pairs = [
+            (country, category)
+            for country in self.countries
+            for category in self.cpi_categories
+            if (country, category) in self.by_pair
+        ]
+        self.cpi_keys = [f"{country}||{category}" for country, category in self.cpi_pairs]
+        self.cpi_pairs_by_country = {}
+        for pair in self.cpi_pairs:
+            self.cpi_pairs_by_country.setdefault(pair[0], []).append(pair)
+        self.pairs_by_category = {}
+        for pair in self.by_pair:
+            self.pairs_by_category.setdefault(pair[1], []).append(pair)
+
+        self.colors = {pair: row["color"] for pair, row in self.by_pair.items() if row["color"]}
+        self.label_colors = {f"{country} – {category}": color for (country, category), color in self.colors.items()}
+        self.category_colors = {category: color for (_, category), color in self.colors.items()}
+
+    def __len__(self):
+        return self.frame.height
+
+    def is_cpi(self, country: str, category: str) -> bool:
+        row = self.by_pair.get((country, category))
+        return row is not None and row["kind"] == "cpi"
+
+    def pairs_of(self, categories) -> list:
+        """The (country, category) pairs of the given categories, in the order given."""
+        return [pair for category in categories for pair in self.pairs_by_category.get(category, ())]
+
+    def sources(self) -> list:
+        """One source per series, as sources.scan_source reads them."""
+        return [
+            {key: value for key, value in row.items() if value is not None and key not in _DISPLAY_COLUMNS}
+            for row in self.by_id.values()
+        ]
+
+
+def load_catalog(path: Path) -> SeriesCatalog:
+    """Read a catalog file; columns beyond the standard ones are passed to the source adapters."""
+    frame = pl.read_csv(path, infer_schema=False)
+    missing = [column for column in ("id", "kind", "country", "category", "adapter") if column not in frame.columns]
+    if missing:
+        raise ValueError(f"{path.name} lacks the columns {missing}")
+    return SeriesCatalog(frame.with_columns(
+        pl.col(column).cast(dtype) for column, dtype in _SCHEMA.items() if column in frame.columns
+    ))
+
+
+def series_catalog() -> SeriesCatalog:
+    """The catalog in use, read from Settings.CATALOG_FILE on first use."""
+    global _active
+    if _active is None:
+        _active = load_catalog(Settings.CATALOG_FILE)
+        logger.debug(f"{len(_active)} series in the catalog")
+    return _active
+
+
+def use_catalog(catalog: SeriesCatalog) -> SeriesCatalog:
+    """Switch the catalog in use, returning the previous one."""
+    global _active
+    previous, _active = _active, catalog
+    return previous
@@ -0,0 +1,164 @@
+import atexit
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from io import BytesIO
+
+import polars as pl
+
+from .config import Settings
+from .session import shared_data
+
+logger = logging.getLogger("app_logger")
+
+__all__ = []
+
+_lock = threading.Lock()
+_pool = None
+# data version -> Arrow IPC file holding that snapshot's full_raw_data
+_shared_files = {}
+# data version -> pooled computations still reading its file
+_in_flight = {}
+# Worker side: the memory-mapped snapshot currently in use
+_mapped = {}
+
+
+def pool_enabled() -> bool:
+    return Settings.COMPUTE_WORKERS > 0
+
+
+def _executor() -> ProcessPoolExecutor:
+    global _pool
+    with _lock:
+        if _pool is None:
+            # spawn: forking a process that runs Tornado and loader threads is unsafe
+            _pool = ProcessPoolExecutor(Settings.COMPUTE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+            atexit.register(_shutdown)
+    return _pool
+
+
+def _shutdown():
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+    for path in _shared_files.values():
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+@contextmanager
+def _shared_frame(data):
+    """Path of the snapshot's full_raw_data, written once as uncompressed Arrow IPC in shared memory.
+
+    Workers memory-map the file, so the frame is never pickled and each
+    worker reads only the pages of the series it slices. Workers open it
+    lazily, so a file is kept while the with block runs, and removed once
+    its snapshot is neither current nor held by a session.
+    """
+    version = data["version"]
+    with _lock:
+        path = _shared_files.get(version)
+        if path is None:
+            folder = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+            path = os.path.join(folder, f"cpi-explorer-{os.getpid()}-v{version}.arrow")
+            data["full_raw_data"].write_ipc(path, compression="uncompressed")
+            _shared_files[version] = path
+        _in_flight[version] = _in_flight.get(version, 0) + 1
+    try:
+        yield path
+    finally:
+        with _lock:
+            _in_flight[version] -= 1
+            if not _in_flight[version]:
+                del _in_flight[version]
+        _remove_retired()
+
+
+def _remove_retired():
+    """Remove the files of snapshots no session or pooled computation reads anymore."""
+    in_use = shared_data.versions_in_use()
+    with _lock:
+        for version in [v for v in _shared_files if v not in in_use and v not in _in_flight]:
+            try:
+                os.remove(_shared_files.pop(version))
+            except OSError:
+                pass
+
+
+shared_data.on_retire(_remove_retired)
+
+
+def _mapped_frame(path: str) -> pl.DataFrame:
+    if path not in _mapped:
+        _mapped.clear()
+        _mapped[path] = pl.read_ipc(path, memory_map=True)
+    return _mapped[path]
+
+
+def _to_ipc(df: pl.DataFrame) -> bytes:
+    buffer = BytesIO()
+    df.write_ipc(buffer, compression="uncompressed")
+    return buffer.getvalue()
+
+
+def _correlations_task(path, index, cpi_pairs, cpi_keys, bench_pairs, benchmarks, date_range, mode):
+    from .corr_engine import _calc_mode_correlations, _mode_transform, _to_wide
+    from .series_index import select_series
+
+    df = _mapped_frame(path)
+    cpi_key = pl.concat_str(["country", "category"], separator="||")
+    cpi_wide = _to_wide(_mode_transform(select_series(df, index, cpi_pairs, date_range), mode), cpi_key)
+    bench_wide = _to_wide(_mode_transform(select_series(df, index, bench_pairs), mode), pl.col("category"))
+    return mode, _calc_mode_correlations(cpi_wide, bench_wide, cpi_keys, benchmarks)
+
+
+def _rolling_task(frame: bytes, cpi, country, benchmarks, window):
+    from .data_processor import _rolling_correlation
+
+    return _to_ipc(_rolling_correlation(pl.read_ipc(BytesIO(frame)), cpi, country, benchmarks, window))
+
+
+def pooled_correlations(data, date_range, cpi_pairs, cpi_keys, bench_pairs, benchmarks) -> dict:
+    """Per-mode pair results of calc_correlations, computed per (country, mode) on the pool."""
+    with _shared_frame(data) as path:
+        return _pooled_correlations(path, data["series_index"], date_range, cpi_pairs, cpi_keys, bench_pairs, benchmarks)
+
+
+def _pooled_correlations(path, index, date_range, cpi_pairs, cpi_keys, bench_pairs, benchmarks) -> dict:
+    present = set(cpi_keys)
+    by_country = {}
+    for country, category in cpi_pairs:
+        by_country.setdefault(country, []).append((country, category))
+    futures = []
+    for pairs in by_country.values():
+        keys = [key for country, category in pairs if (key := f"{country}||{category}") in present]
+        if not keys:
+            continue
+        needed = {pair: index[pair] for pair in pairs + bench_pairs if pair in index}
+        for mode in Settings.MODES:
+            futures.append(_executor().submit(
+                _correlations_task, path, needed, pairs, keys, bench_pairs, benchmarks, date_range, mode
+            ))
+    by_mode = {mode: {} for mode in Settings.MODES}
+    for future in futures:
+        mode, results = future.result()
+        by_mode[mode].update(results)
+    return by_mode
+
+
+def pooled_rolling_correlation(df: pl.DataFrame, cpi, country, benchmarks, window) -> list:
+    """Rolling correlation frames, with the benchmarks spread over the pool."""
+    frame = _to_ipc(df)
+    # Contiguous chunks keep the merged rows in benchmark order
+    size = -(-len(benchmarks) // Settings.COMPUTE_WORKERS)
+    futures = [
+        _executor().submit(_rolling_task, frame, cpi, country, benchmarks[i:i + size], window)
+        for i in range(0, len(benchmarks), size)
+    ]
+    frames = [pl.read_ipc(BytesIO(future.result())) for future in futures]
+    return [frame for frame in frames if frame.width]
@@ -1,3 +1,4 @@
+from datetime import date, timedelta
 from pathlib import Path
 
 __all__ = ["Settings"]
@@ -6,36 +7,68 @@ class Settings:
     PORT = 5007
     ENV = "dev"
     DATA_FOLDER = Path(Path.cwd().parent).joinpath("data")
+    CACHE_FOLDER = DATA_FOLDER.joinpath(".cache")
+    # One row per series: id, kind (cpi/benchmark), country, category, source
+    # (adapter plus series_id or file), frequency, color and the year it is rebased to
+    CATALOG_FILE = Path.cwd().joinpath("series_catalog.csv")
+    # Base year of the CPI indices, as shown on the index axis
     BASE_YEAR = 2015
-    CPI_CATEGORIES = ["Food", "Total"]
-    BENCHMARK_CATEGORIES = ["Brent-Oil", "10-Year TY", "USD/EUR Spot", "Food Price Index", "ECB Food Commodity Index"]
-    COUNTRIES = ["Denmark", "Netherlands"]
     MODES = ["Index", "MoM %", "YoY %"]
+    # Resolution the correlations and plots work at ("daily", "weekly", "monthly", "quarterly"):
+    # series are stored at their native frequency and resampled to it
+    ANALYSIS_FREQUENCY = "monthly"
+    # How the observations of one period are combined: "mean", "median" or "last"
+    RESAMPLE_AGGREGATION = "mean"
     HEIGHT = 500
+    # Decimation of long series to screen width ("lttb", "minmax", "m4"; "minmax-lttb"
+    # needs tsdownsample), None to ship every point
+    DOWNSAMPLE_ALGORITHM = "lttb"
     CARD_WIDTH = 270
-    PLOT_COLORS = {
-        ("Denmark", "Total"): "#78a3c5",        
-        ("Denmark", "Food"): "#e6a96e",         
-        ("Netherlands", "Total"): "#7fb27d",    
-        ("Netherlands", "Food"): "#d1797a",     
-        ("Global (Oil)", "Brent-Oil"): "#9b7b74",
-        ("USA", "10-Year TY"):"#bee706" , 
-        ("Global (USD/EUR)", "USD/EUR Spot"):"#f1bb1b",
-        ("Global (FAO)", "Food Price Index"):"#30f11b",
-        ("EU (ECB)", "ECB Food Commodity Index"): "#da489f",
-    }
-    CPI_FILES = {
-        "Denmark_Total":"CP0000DKM086NEST",
-        "Netherlands_Total":"CP0000NLM086NEST",
-        "Denmark_Food":"CP0110DKM086NEST",
-        "Netherlands_Food":"CP0110NLM086NEST",
+    # dtype of the series values: "Float64", or "Float32" to halve their memory
+    VALUE_DTYPE = "Float64"
+    MEMO_MAX_ENTRIES = 512
+    MEMO_MAX_BYTES = 256 * 1024 ** 2
+    MEMO_TTL = 6 * 3600
+    # Countries whose windowed-correlation prefix sums are kept for slider drags
+    CORRELATION_INDEX_COUNTRIES = 8
+    # Window of the rolling correlation plot, in observations
+    ROLLING_WINDOW = 12
+    # Lead/lag scan of the Correlations tab: lags of up to LAG_MAX months either way, taken
+    # in periods of the analysis frequency, each needing LAG_MIN_OVERLAP paired observations
+    LAG_MAX = 24
+    LAG_MIN_OVERLAP = 12
+    # Date windows precomputed into the correlation cube and offered as slider presets:
+    # None is the full history, an int the trailing years, a date a fixed start
+    CORRELATION_CUBE = True
+    CUBE_WINDOWS = {
+        "Full history": None,
+        "Last 10 years": 10,
+        "Last 5 years": 5,
+        "Last 3 years": 3,
+        "Last year": 1,
+        "Since 2015": date(2015, 1, 1),
     }
+    # Largest CPI selection whose rolling correlations are precomputed
+    CUBE_MAX_CPI_SELECTION = 2
+    # Worker processes for calc_correlations / compute_rolling_correlation, 0 computes in-process
+    COMPUTE_WORKERS = 0
+    # Serve immediately and load data on a background thread; sessions wait for it
+    DEFERRED_LOADING = True
+    READY_POLL_MS = 500
+    # Interval of the incremental data refresh, None to load once at startup
+    REFRESH_PERIOD = timedelta(hours=6)
+    # How often sessions check for a refreshed data snapshot
+    SNAPSHOT_POLL_MS = 5000
+    HEALTH_ROUTE = "/health"
+    METRICS_ROUTE = "/metrics"
+    METRICS_PREFIX = "cpi_explorer"
+    SLOW_CALLBACK_SECONDS = 0.5
     FRED_BASE_URL = "https://fred.stlouisfed.org/graph/fredgraph.csv?id="
-    BRENT_FILE = "MCOILBRENTEU.csv"
-    TY10_FILE = "GS10.csv"
-    USDEUR_SPOT_FILE = "EXUSEU.csv"
-    FAO_FOOD_FILE = "food_price_indices_data_jul25.csv"
-    ECB_FODD_INDEX_FILE = "STS_M_I9_N_ECPE_CFOOD0_3_000.csv"
+    FRED_WORKERS = 8
+    FRED_TIMEOUT = 10
+    FRED_RETRIES = 2
+    FRED_BACKOFF = 0.5
+    MIRROR_FOLDER = CACHE_FOLDER.joinpath("fred")
     PEARSON_COL="#ff7f0e"
     SPEARMAN_COL="#1f77b4"
     TAB_NAMES = {
@@ -44,5 +77,10 @@ class Settings:
         2: "Benchmarks Analysis",
         # fallback/default for unknown tabs
     }
-    DOWNLOADS_FILES = ["full_raw_data","full_correlations_data","filtered_correlations_data","strongest_weakest_correlations"]
+    EXPORT_ROUTE = "/export"
+    # Rows encoded per streamed chunk of an export
+    EXPORT_CHUNK_ROWS = 50_000
+    EXPORT_FORMATS = ["CSV", "Parquet", "Arrow IPC"]
+    EXPORT_COMPRESSIONS = ["None", "gzip", "zstd"]
+    DOWNLOADS_FILES = ["full_raw_data","native_data","full_correlations_data","filtered_correlations_data","strongest_weakest_correlations"]
     
\ No newline at end of file
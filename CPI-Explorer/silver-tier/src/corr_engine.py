@@ -0,0 +1,452 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import polars as pl
+
+from .alignment import date_grid, months_to_periods, periods_per_year
+from .catalog import series_catalog
+from .config import Settings
+from .session import session_state
+
+__all__ = ["build_correlation_index", "windowed_correlations", "lag_correlations", "lag_spearman"]
+
+_CORR_VARIANTS = {"": "value", " (EMA3)": "ema3", " (EMA6)": "ema6"}
+
+
+def _mode_warmup(mode: str) -> int:
+    """Leading CPI rows a window loses when the mode is applied inside the window."""
+    return {"Index": 0, "MoM %": 1, "YoY %": periods_per_year()}[mode]
+
+
+def _mode_value(mode: str) -> pl.Expr:
+    """The change mode as an expression over one date-sorted series at the analysis frequency."""
+    if mode == "MoM %":
+        return pl.col("value").pct_change()
+    if mode == "YoY %":
+        return pl.col("value") / pl.col("value").shift(periods_per_year()) - 1
+    return pl.col("value")
+
+
+def _mode_transform(df: pl.DataFrame, mode: str) -> pl.DataFrame:
+    """Apply the change mode and the EMA3/EMA6 smoothing to every series at once."""
+    series = ["country", "category"]
+    return (
+        df.sort("date")
+        .with_columns(_mode_value(mode).over(series).alias("value"))
+        .with_columns(
+            pl.col("value").ewm_mean(span=3).over(series).alias("ema3"),
+            pl.col("value").ewm_mean(span=6).over(series).alias("ema6"),
+        )
+    )
+
+
+def _to_wide(df: pl.DataFrame, key: pl.Expr) -> pl.DataFrame:
+    """Pivot a transformed long frame to date x (variant, series) columns."""
+    return (
+        df.with_columns(key.alias("series"))
+        .pivot(on="series", index="date", values=list(_CORR_VARIANTS.values()), separator="|")
+    )
+
+
+def _corr_block(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """Pearson correlation of every column of x with every column of y (no nulls)."""
+    x = x - x.mean(axis=0)
+    y = y - y.mean(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return (x.T @ y) / np.outer(np.sqrt((x * x).sum(axis=0)), np.sqrt((y * y).sum(axis=0)))
+
+
+def _rank(x: np.ndarray) -> np.ndarray:
+    return pl.DataFrame(x).select(pl.all().rank()).to_numpy()
+
+
+def _mask_groups(wide: pl.DataFrame, keys: list) -> dict:
+    """Group series by the rows where all their variants are present."""
+    valid = wide.select(
+        pl.all_horizontal(pl.col(f"{col}|{k}").is_not_null() for col in _CORR_VARIANTS.values()).alias(k)
+        for k in keys
+    ).to_numpy()
+    groups = {}
+    for i, k in enumerate(keys):
+        groups.setdefault(valid[:, i].tobytes(), (valid[:, i], []))[1].append(k)
+    return groups
+
+
+def _calc_mode_correlations(cpi_wide: pl.DataFrame, bench_wide: pl.DataFrame, cpi_keys: list, benchmarks: list) -> dict:
+    """Pearson and Spearman for all CPI x benchmark pairs of one mode.
+
+    Pairs are evaluated in blocks sharing the same set of valid dates, so the
+    work is a handful of matrix products instead of one join per pair.
+    """
+    wide = cpi_wide.join(bench_wide, on="date", how="inner").sort("date")
+    results = {}
+    if wide.is_empty():
+        return results
+    for cpi_mask, cpi_group in _mask_groups(wide, cpi_keys).values():
+        for bench_mask, bench_group in _mask_groups(wide, benchmarks).values():
+            rows = wide.filter(pl.Series(cpi_mask & bench_mask))
+            if rows.height < 2:
+                continue
+            for suffix, col in _CORR_VARIANTS.items():
+                x = rows.select(f"{col}|{k}" for k in cpi_group).to_numpy()
+                y = rows.select(f"{col}|{b}" for b in bench_group).to_numpy()
+                pearson = _corr_block(x, y)
+                spearman = _corr_block(_rank(x), _rank(y))
+                for i, key in enumerate(cpi_group):
+                    for j, bench in enumerate(bench_group):
+                        pair = results.setdefault((key, bench), {})
+                        pair[f"Pearson{suffix}"] = round(float(pearson[i, j]), 3)
+                        pair[f"Spearman{suffix}"] = round(float(spearman[i, j]), 3)
+    return results
+
+
+def _correlation_frame(by_mode: dict, cpi_keys: list, benchmarks: list) -> pl.DataFrame:
+    """Flatten per-mode pair results into the full_correlations_data layout."""
+    results = []
+    for key in cpi_keys:
+        country, cpi_cat = key.split("||")
+        for mode in Settings.MODES:
+            for bench in benchmarks:
+                if (corrs := by_mode[mode].get((key, bench))) is None:
+                    continue
+                results.append({
+                    "country": country,
+                    "CPI": cpi_cat,
+                    "benchmark": bench,
+                    "mode": mode,
+                    "Pearson": corrs["Pearson"],
+                    "Pearson (EMA3)": corrs["Pearson (EMA3)"],
+                    "Pearson (EMA6)": corrs["Pearson (EMA6)"],
+                    "Spearman": corrs["Spearman"],
+                    "Spearman (EMA3)": corrs["Spearman (EMA3)"],
+                    "Spearman (EMA6)": corrs["Spearman (EMA6)"]
+                })
+
+    return pl.DataFrame(results)
+
+
+def _prefix_stats(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """Prefix sums of (n, Σx, Σy, Σxy, Σx², Σy²) for every column pair of x and y.
+
+    x is (T, C, V) and y is (T, B, V) with NaN for missing observations; a row
+    counts for a pair only when all V variants of both series are present.
+    The result has shape (6, T + 1, C, B, V) with a leading row of zeros.
+    """
+    x = x - np.nanmean(x, axis=0)
+    y = y - np.nanmean(y, axis=0)
+    valid = (~np.isnan(x).any(axis=2))[:, :, None] & (~np.isnan(y).any(axis=2))[:, None, :]
+    m = valid[..., None].astype(float)
+    xm = np.nan_to_num(x)[:, :, None, :] * m
+    ym = np.nan_to_num(y)[:, None, :, :] * m
+    stats = np.stack([m.repeat(x.shape[2], axis=3), xm, ym, xm * ym, xm * xm, ym * ym])
+    prefix = np.zeros((6, stats.shape[1] + 1, *stats.shape[2:]))
+    np.cumsum(stats, axis=1, out=prefix[:, 1:])
+    return prefix
+
+
+def _window_corr(prefix: np.ndarray, lo: int, hi: int) -> tuple:
+    n, sx, sy, sxy, sxx, syy = prefix[:, hi].astype(float) - prefix[:, lo]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        r = (n * sxy - sx * sy) / np.sqrt((n * sxx - sx * sx) * (n * syy - sy * sy))
+    return n, r
+
+
+class CorrelationIndex:
+    """Windowed Pearson/Spearman lookups over precomputed prefix sums.
+
+    The mode transforms and EMAs are applied once over the full history, so a
+    window's Pearson is the difference of two prefix rows. Spearman is
+    approximated by the Pearson of full-history ranks and the EMAs keep their
+    pre-window memory; ``calc_correlations`` remains the exact path.
+
+    Prefix sums are built per country on first use and kept as float32, for
+    at most Settings.CORRELATION_INDEX_COUNTRIES countries at a time, least
+    recently used out first.
+    """
+
+    def __init__(self, df: pl.DataFrame, benchmarks: list):
+        self.df = df
+        self.benchmarks = benchmarks
+        self._lock = threading.Lock()
+        self._countries = OrderedDict()
+
+    def _build(self, country: str) -> dict:
+        cpi_key = pl.concat_str(["country", "category"], separator="||")
+        cpi_raw = self.df.filter(
+            (pl.col("country") == country) &
+            pl.col("category").is_in(series_catalog().cpi_categories)
+        )
+        present = set(cpi_raw.select(cpi_key).to_series())
+        built = {
+            "cpi_keys": [key for key in series_catalog().cpi_keys if key in present],
+            "dates": {}, "pearson": {}, "spearman": {},
+        }
+        if not built["cpi_keys"]:
+            return built
+        bench_raw = self.df.filter(pl.col("category").is_in(self.benchmarks))
+        for mode in Settings.MODES:
+            wide = (
+                _to_wide(_mode_transform(cpi_raw, mode), cpi_key)
+                .join(_to_wide(_mode_transform(bench_raw, mode), pl.col("category")), on="date", how="inner")
+                .sort("date")
+            )
+            ranked = wide.select(pl.col("date"), pl.exclude("date").rank())
+            built["dates"][mode] = wide.get_column("date").to_numpy()
+            for name, frame in (("pearson", wide), ("spearman", ranked)):
+                prefix = _prefix_stats(self._stack(frame, built["cpi_keys"]), self._stack(frame, self.benchmarks))
+                built[name][mode] = prefix.astype(np.float32)
+        return built
+
+    def _country(self, country: str) -> dict:
+        with self._lock:
+            built = self._countries.get(country)
+            if built is not None:
+                self._countries.move_to_end(country)
+                return built
+        # Built outside the lock; two sessions racing for one country both build it once
+        built = self._build(country)
+        with self._lock:
+            self._countries[country] = built
+            while len(self._countries) > Settings.CORRELATION_INDEX_COUNTRIES:
+                self._countries.popitem(last=False)
+        return built
+
+    @staticmethod
+    def _stack(wide: pl.DataFrame, keys: list) -> np.ndarray:
+        return np.stack(
+            [wide.select(f"{col}|{k}" for k in keys).to_numpy().astype(float) for col in _CORR_VARIANTS.values()],
+            axis=2
+        )
+
+    def correlations(self, date_range: tuple, countries: list = None) -> pl.DataFrame:
+        """All pairs of the countries (default all) for all modes over date_range, in the calc_correlations layout."""
+        by_mode = {mode: {} for mode in Settings.MODES}
+        cpi_keys = []
+        for country in countries or series_catalog().countries:
+            built = self._country(country)
+            cpi_keys += built["cpi_keys"]
+            for mode in Settings.MODES:
+                if not built["cpi_keys"]:
+                    break
+                dates = built["dates"][mode]
+                lo = np.searchsorted(dates, np.datetime64(date_range[0], "D"), side="left") + _mode_warmup(mode)
+                hi = max(np.searchsorted(dates, np.datetime64(date_range[1], "D"), side="right"), lo)
+                n, pearson = _window_corr(built["pearson"][mode], lo, hi)
+                _, spearman = _window_corr(built["spearman"][mode], lo, hi)
+                results = by_mode[mode]
+                for i, key in enumerate(built["cpi_keys"]):
+                    for j, bench in enumerate(self.benchmarks):
+                        if n[i, j, 0] < 2:
+                            continue
+                        results[key, bench] = {
+                            f"{method}{suffix}": round(float(values[i, j, v]), 3)
+                            for method, values in (("Pearson", pearson), ("Spearman", spearman))
+                            for v, suffix in enumerate(_CORR_VARIANTS)
+                        }
+        return _correlation_frame(by_mode, cpi_keys, self.benchmarks)
+
+
+def build_correlation_index(df: pl.DataFrame, benchmarks: list) -> CorrelationIndex:
+    return CorrelationIndex(df, benchmarks)
+
+
+def windowed_correlations(date_range: tuple, countries: list = None) -> pl.DataFrame:
+    return session_state().data["correlation_index"].correlations(date_range, countries)
+
+
+# Pairings of the (mask, x, x²) and (mask, y, y²) spectra giving n, Σx, Σy, Σxy, Σx², Σy²
+_LAG_SUMS = ((0, 0), (1, 0), (0, 1), (1, 1), (2, 0), (0, 2))
+
+
+def _lagged_stats(x: np.ndarray, y: np.ndarray, max_lag: int) -> np.ndarray:
+    """Sufficient statistics of every column pair of x and y at every lag, via FFT.
+
+    x is (M, T, C) and y is (M, T, B) on one regular date grid, NaN where a
+    series has no value. Lag k pairs x at t with y at t - k, so positive
+    lags are y leading x. A row counts at a lag only when both values are
+    present. Returns (6, M, 2 max_lag + 1, C, B) sums of (n, Σx, Σy, Σxy,
+    Σx², Σy²), lags ascending from -max_lag.
+    """
+    x = x - np.nanmean(x, axis=1, keepdims=True)
+    y = y - np.nanmean(y, axis=1, keepdims=True)
+    mx, my = (~np.isnan(x)).astype(float), (~np.isnan(y)).astype(float)
+    x, y = np.nan_to_num(x), np.nan_to_num(y)
+    # Zero padding of max_lag rows keeps the circular correlation from wrapping
+    size = 1 << (x.shape[1] + max_lag - 1).bit_length()
+    fx = np.fft.rfft(np.stack([mx, x, x * x]), size, axis=2)
+    fy = np.conj(np.fft.rfft(np.stack([my, y, y * y]), size, axis=2))
+    stats = np.empty((len(_LAG_SUMS), x.shape[0], 2 * max_lag + 1, x.shape[2], y.shape[2]))
+    for s, (i, j) in enumerate(_LAG_SUMS):
+        sums = np.fft.irfft(fx[i][..., :, None] * fy[j][..., None, :], size, axis=1)
+        # Negative lags wrap around to the end
+        stats[s, :, :max_lag] = sums[:, size - max_lag:]
+        stats[s, :, max_lag:] = sums[:, :max_lag + 1]
+    stats[0] = np.rint(stats[0])
+    return stats
+
+
+def _lagged_corr(stats: np.ndarray) -> np.ndarray:
+    n, sx, sy, sxy, sxx, syy = stats
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return (n * sxy - sx * sy) / np.sqrt((n * sxx - sx * sx) * (n * syy - sy * sy))
+
+
+def _on_grid(df: pl.DataFrame, key: pl.Expr, keys: list, grid: pl.DataFrame, mode: str) -> pl.DataFrame:
+    """Series of a compact frame in mode, one column per key, on the rows of grid."""
+    wide = (
+        df.with_columns(_mode_value(mode).over(["country", "category"]).alias("value"), key.alias("series"))
+        .pivot(on="series", index="date", values="value")
+    )
+    return grid.join(wide, on="date", how="left").select(
+        pl.col(k) if k in wide.columns else pl.lit(None, pl.Float64).alias(k) for k in keys
+    )
+
+
+def lag_correlations(cpi_raw: pl.DataFrame, bench_raw: pl.DataFrame, cpi_keys: list, benchmarks: list) -> pl.DataFrame:
+    """Pearson of every CPI x benchmark pair and mode at lags up to Settings.LAG_MAX months.
+
+    cpi_raw holds the CPI series of the window, bench_raw the full history
+    of the benchmarks, so leads and lags reach values outside the window.
+    All pairs, modes and lags come out of one batch of FFTs over the date
+    grid instead of a join per lag. Lags with fewer than
+    Settings.LAG_MIN_OVERLAP paired observations are left out; see
+    lag_spearman for the rank correlation. Lags are counted in periods of
+    the analysis frequency.
+    """
+    max_lag = months_to_periods(Settings.LAG_MAX)
+    if cpi_raw.is_empty() or not cpi_keys or not benchmarks:
+        return pl.DataFrame()
+    dates = cpi_raw.get_column("date")
+    grid = pl.DataFrame({"date": date_grid(dates.min(), dates.max(), max_lag)})
+    cpi_key = pl.concat_str(["country", "category"], separator="||")
+
+    def stack(raw, key, keys):
+        return np.stack([_on_grid(raw.sort("date"), key, keys, grid, mode).to_numpy().astype(float) for mode in Settings.MODES])
+
+    # (6, mode, lag, CPI, benchmark) -> (6, CPI, mode, benchmark, lag), the row order of the result
+    stats = _lagged_stats(
+        stack(cpi_raw, cpi_key, cpi_keys), stack(bench_raw, pl.col("category"), benchmarks), max_lag
+    ).transpose(0, 3, 1, 4, 2)
+    n = stats[0]
+    cpi_i, mode_i, bench_i, lag_i = np.indices(n.shape).reshape(4, -1)
+    countries, categories = zip(*(key.split("||") for key in cpi_keys))
+    return (
+        pl.DataFrame({
+            "country": pl.Series(countries).gather(cpi_i),
+            "CPI": pl.Series(categories).gather(cpi_i),
+            "benchmark": pl.Series(benchmarks).gather(bench_i),
+            "mode": pl.Series(Settings.MODES).gather(mode_i),
+            "lag": lag_i - max_lag,
+            "Pearson": _lagged_corr(stats).reshape(-1),
+            "observations": n.reshape(-1).astype(np.int64),
+        })
+        .filter((pl.col("observations") >= Settings.LAG_MIN_OVERLAP) & pl.col("Pearson").is_not_nan())
+        .with_columns(pl.col("Pearson").round(3))
+    )
+
+
+def _rank_slots(values: np.ndarray, positions: np.ndarray) -> tuple:
+    """Where values[positions] fall in the sorted values: (slot, start, end) of their tie group.
+
+    values is 1-d with non-finite entries as +inf and is sorted only once;
+    _masked_ranks then ranks any subset of it from running counts.
+    """
+    order = np.argsort(values, kind="stable")
+    ordered = values[order]
+    new_group = np.r_[True, ordered[1:] != ordered[:-1]]
+    group = np.cumsum(new_group) - 1
+    first = np.flatnonzero(new_group)
+    last = np.r_[first[1:], len(values)]
+    slot_of = np.empty(len(values), dtype=np.intp)
+    slot_of[order] = np.arange(len(values))
+    slots = slot_of[positions]
+    return slots, first[group[slots]], last[group[slots]]
+
+
+def _masked_ranks(rank_slots: tuple, mask: np.ndarray, size: int) -> np.ndarray:
+    """Twice the average ranks of the entries each row of mask selects, among those entries.
+
+    rank_slots comes from _rank_slots over size values. Doubled, average
+    ranks are integers; entries outside the mask are 0.
+    """
+    slots, start, end = (np.broadcast_to(a, mask.shape) for a in rank_slots)
+    # counts[:, s]: selected entries in slots below s
+    counts = np.zeros((len(mask), size + 1), dtype=np.int32)
+    np.put_along_axis(counts[:, 1:], slots, mask, axis=1)
+    np.cumsum(counts, axis=1, out=counts)
+    ranks = np.take_along_axis(counts, start, axis=1)
+    ranks += np.take_along_axis(counts, end, axis=1)
+    ranks += 1
+    ranks *= mask
+    return ranks
+
+
+def _lagged_spearman(x: tuple, y: tuple, max_lag: int) -> tuple:
+    """Spearman of a CPI against a benchmark at every lag, ranked over each lag's overlap.
+
+    x is (window values, rank slots) and y (grid values, rank slots), as
+    prepared by lag_spearman. Returns (observations, Spearman) per lag,
+    ascending from -max_lag, with lags as in _lagged_stats.
+    """
+    (xw, x_slots), (yv, y_slots) = x, y
+    x_present = np.isfinite(xw)
+    mask = x_present[None, :] & np.isfinite(yv)[_lag_positions(len(xw), max_lag)]
+    # Lags where the benchmark covers every CPI observation share the CPI ranks
+    full = (mask == x_present).all(axis=1)
+    rx = np.empty(mask.shape, dtype=np.int32)
+    rx[full] = _masked_ranks(x_slots, x_present[None, :], len(xw))
+    if not full.all():
+        rx[~full] = _masked_ranks(x_slots, mask[~full], len(xw))
+    ry = _masked_ranks(y_slots, mask, len(yv))
+    # Sums of the doubled ranks are exact in int64; the correlation is scale-free
+    def dot(a, b):
+        return np.einsum("ij,ij->i", a, b, dtype=np.int64)
+    n = mask.sum(axis=1)
+    stats = np.stack([n, rx.sum(1, dtype=np.int64), ry.sum(1, dtype=np.int64), dot(rx, ry), dot(rx, rx), dot(ry, ry)])
+    return n, _lagged_corr(stats.astype(float))
+
+
+def _lag_positions(width: int, max_lag: int) -> np.ndarray:
+    """Grid positions of the benchmark paired with the window at each lag, ascending from -max_lag."""
+    return (2 * max_lag - np.arange(2 * max_lag + 1))[:, None] + np.arange(width)
+
+
+def lag_spearman(cpi_raw: pl.DataFrame, bench_raw: pl.DataFrame, cpi_keys: list, benchmarks: list, mode: str) -> pl.DataFrame:
+    """Spearman of every CPI x benchmark pair in mode at lags up to Settings.LAG_MAX months.
+
+    Ranks are taken over each lag's overlapping observations, which no sums
+    shared between lags give, so the cost grows with pairs x lags x periods;
+    meant for the few CPI of a selection. Each series is sorted once and
+    every lag is ranked from running counts in that order. Lags follow
+    lag_correlations.
+    """
+    max_lag = months_to_periods(Settings.LAG_MAX)
+    if cpi_raw.is_empty() or not cpi_keys or not benchmarks:
+        return pl.DataFrame()
+    dates = cpi_raw.get_column("date")
+    grid = pl.DataFrame({"date": date_grid(dates.min(), dates.max(), max_lag)})
+    cpi_key = pl.concat_str(["country", "category"], separator="||")
+    x = _on_grid(cpi_raw.sort("date"), cpi_key, cpi_keys, grid, mode).to_numpy().astype(float)
+    y = _on_grid(bench_raw.sort("date"), pl.col("category"), benchmarks, grid, mode).to_numpy().astype(float)
+    x, y = np.where(np.isfinite(x), x, np.inf), np.where(np.isfinite(y), y, np.inf)
+    # The CPI values of the window between the max_lag pads of the grid
+    width = len(x) - 2 * max_lag
+    x_series = [(x[max_lag:max_lag + width, i], _rank_slots(x[max_lag:max_lag + width, i], np.arange(width)[None, :]))
+                for i in range(len(cpi_keys))]
+    y_series = [(y[:, j], _rank_slots(y[:, j], _lag_positions(width, max_lag))) for j in range(len(benchmarks))]
+    rows = []
+    for i, key in enumerate(cpi_keys):
+        country, category = key.split("||")
+        for j, benchmark in enumerate(benchmarks):
+            n, spearman = _lagged_spearman(x_series[i], y_series[j], max_lag)
+            rows.append(pl.DataFrame({
+                "country": country, "CPI": category, "benchmark": benchmark,
+                "lag": np.arange(-max_lag, max_lag + 1), "Spearman": spearman, "observations": n,
+            }))
+    return (
+        pl.concat(rows)
+        .filter(pl.col("observations") >= Settings.LAG_MIN_OVERLAP)
+        .with_columns(pl.col("Spearman").fill_nan(None).round(3))
+        .select("country", "CPI", "benchmark", "lag", "Spearman")
+    )
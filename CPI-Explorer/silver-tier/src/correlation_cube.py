@@ -0,0 +1,175 @@
+import datetime as dt
+import hashlib
+import logging
+import threading
+from functools import partial
+from itertools import permutations
+
+import polars as pl
+
+from .catalog import series_catalog
+from .config import Settings
+
+logger = logging.getLogger("app_logger")
+
+__all__ = ["standard_windows", "cube_correlations", "cube_rolling"]
+
+# Bump when the cube layout or the computations it stores change
+CUBE_VERSION = 2
+CUBE_FOLDER = "cube"
+
+_lock = threading.Lock()
+# data version -> CorrelationCube of that snapshot
+_cubes = {}
+
+
+def standard_windows(min_date: dt.date, max_date: dt.date) -> dict:
+    """Name -> (start, end) of every Settings.CUBE_WINDOWS window, clipped to the data."""
+    windows = {}
+    for name, spec in Settings.CUBE_WINDOWS.items():
+        if spec is None:
+            start = min_date
+        elif isinstance(spec, int):
+            try:
+                start = max_date.replace(year=max_date.year - spec)
+            except ValueError:
+                # 29 February
+                start = max_date.replace(year=max_date.year - spec, day=28)
+        else:
+            start = spec
+        windows[name] = (max(start, min_date), max_date)
+    return windows
+
+
+def cpi_combinations() -> list:
+    """Every ordered CPI selection up to CUBE_MAX_CPI_SELECTION categories.
+
+    The order sets the order of the per-category blocks of the rolling
+    correlations; larger selections are computed live.
+    """
+    categories = series_catalog().cpi_categories
+    sizes = range(1, min(len(categories), Settings.CUBE_MAX_CPI_SELECTION) + 1)
+    return [list(combo) for size in sizes for combo in permutations(categories, size)]
+
+
+def _span(dates: pl.Series, date_range: tuple):
+    """First and last data date inside date_range, None if it holds none."""
+    first = dates.search_sorted(date_range[0], side="left")
+    last = dates.search_sorted(date_range[1], side="right") - 1
+    if first > last:
+        return None
+    return dates[first], dates[last]
+
+
+def window_spans(data) -> list:
+    """The distinct data spans of the standard windows; windows selecting the same rows share one."""
+    dates = data["full_raw_data"].get_column("date").unique().sort()
+    spans = map(partial(_span, dates), standard_windows(data["min_date"], data["max_date"]).values())
+    return list(dict.fromkeys(span for span in spans if span is not None))
+
+
+class CorrelationCube:
+    """Correlations and rolling correlations of the standard windows, keyed for lookup.
+
+    A date range is matched by the data dates it covers rather than by its
+    bounds, so any range that selects the same rows as a stored window is a
+    hit and gets exactly the frame the live computation would return.
+    """
+
+    def __init__(self, data, correlations: pl.DataFrame, rolling: pl.DataFrame):
+        self.dates = data["full_raw_data"].get_column("date").unique().sort()
+        self.spans = set(window_spans(data))
+        self.cpi_keys = {"||".join(combo) for combo in cpi_combinations()}
+        self._correlations = correlations.partition_by("start", "end", as_dict=True, include_key=False)
+        self._rolling = {
+            key: frame.drop("start", "end", "country", "mode", "cpi")
+            for key, frame in rolling.partition_by("start", "end", "country", "mode", "cpi", "benchmark", as_dict=True).items()
+        }
+
+    def correlations(self, date_range: tuple):
+        return self._correlations.get(_span(self.dates, date_range))
+
+    def rolling(self, country: str, cpi: list, mode: str, date_range: tuple, benchmarks: list, window: int):
+        span = _span(self.dates, date_range)
+        cpi_key = "||".join(cpi)
+        if (
+            span not in self.spans or cpi_key not in self.cpi_keys or window != Settings.ROLLING_WINDOW
+            or country not in series_catalog().cpi_pairs_by_country or mode not in Settings.MODES
+        ):
+            return None
+        # Benchmarks without enough overlap have no rows, as in the live computation
+        frames = [
+            self._rolling[key]
+            for bench in benchmarks
+            if (key := (*span, country, mode, cpi_key, bench)) in self._rolling
+        ]
+        return pl.concat(frames) if frames else pl.DataFrame()
+
+
+def fingerprint(data) -> str:
+    """Digest of everything the cube depends on: the data, the settings and the polars version."""
+    digest = hashlib.sha256()
+    digest.update(repr((
+        CUBE_VERSION, pl.__version__, series_catalog().cpi_pairs, Settings.MODES, data["categories"],
+        Settings.ANALYSIS_FREQUENCY, Settings.ROLLING_WINDOW, Settings.CUBE_WINDOWS, Settings.CUBE_MAX_CPI_SELECTION,
+    )).encode())
+    # A clone: hash_rows borrows the frame mutably and sessions read it meanwhile
+    digest.update(data["full_raw_data"].clone().hash_rows().to_numpy().tobytes())
+    return digest.hexdigest()[:16]
+
+
+def _paths(data) -> tuple:
+    folder = Settings.CACHE_FOLDER.joinpath(CUBE_FOLDER)
+    key = fingerprint(data)
+    return folder.joinpath(f"correlations-{key}.parquet"), folder.joinpath(f"rolling-{key}.parquet")
+
+
+def load_cube(data):
+    """The stored cube of this snapshot, None when it was not built yet."""
+    correlations_path, rolling_path = _paths(data)
+    if not (correlations_path.exists() and rolling_path.exists()):
+        return None
+    try:
+        return CorrelationCube(data, pl.read_parquet(correlations_path), pl.read_parquet(rolling_path))
+    except Exception as ex:
+        logger.warning(f"Correlation cube unreadable, rebuilding it: {ex}")
+        return None
+
+
+def save_cube(data, correlations: pl.DataFrame, rolling: pl.DataFrame) -> CorrelationCube:
+    """Write the cube as Parquet, replacing cubes of earlier data, and return it."""
+    correlations_path, rolling_path = _paths(data)
+    try:
+        correlations_path.parent.mkdir(parents=True, exist_ok=True)
+        for old in correlations_path.parent.glob("*.parquet"):
+            old.unlink()
+        correlations.write_parquet(correlations_path)
+        rolling.write_parquet(rolling_path)
+    except OSError as ex:
+        logger.warning(f"Could not store the correlation cube: {ex}")
+    return CorrelationCube(data, correlations, rolling)
+
+
+def register(data, cube: CorrelationCube):
+    with _lock:
+        # Sessions pinned to older snapshots fall back to live computation
+        _cubes.clear()
+        _cubes[data["version"]] = cube
+
+
+def cube_for(data):
+    if data is None or not Settings.CORRELATION_CUBE:
+        return None
+    return _cubes.get(data["version"])
+
+
+def cube_correlations(data, date_range: tuple):
+    """calc_correlations output for date_range if it is a standard window, else None."""
+    cube = cube_for(data)
+    return cube.correlations(date_range) if cube else None
+
+
+def cube_rolling(data, country: str, cpi: list, mode: str, date_range: tuple, benchmarks: list, window: int):
+    """compute_rolling_correlation output for a standard window, else None."""
+    cube = cube_for(data)
+    return cube.rolling(country, cpi, mode, date_range, benchmarks, window) if cube else None
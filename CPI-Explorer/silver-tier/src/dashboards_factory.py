@@ -1,38 +1,40 @@
 import panel as pn
 
-from .widgets import *
 from .card_manager import *
+from .session import session_state
 
 __all__ = ['create_dashboard','create_sidebar']
 
 def create_sidebar():
+    w = session_state().widgets
     sidebar = pn.Column(
         pn.pane.Markdown("## Options", styles={"font-weight": "bold"}),
         pn.Spacer(height=20),
         pn.layout.Divider(),
         pn.pane.Markdown("#### Countries"),
-        country_selector,
+        w.country_selector,
         pn.Spacer(height=20),
         pn.layout.Divider(),
         pn.pane.Markdown(" #### CPI"),
-        cpi_selector, 
+        w.cpi_selector, 
         pn.Spacer(height=20),
         pn.layout.Divider(),
         pn.pane.Markdown(" ### Benchmark Auto Selection"),        
         pn.pane.Markdown(" #### Strongest Correlation"),        
-        corr_strength,
+        w.corr_strength,
         pn.Spacer(height=20),
         
         pn.pane.Markdown(" #### Correlation Type"),        
-        corr_type_selector,
+        w.corr_type_selector,
         pn.Spacer(height=20),
         pn.layout.Divider(),
         pn.pane.Markdown("#### Benchmark indices"),
-        benchmark_selector,
+        w.benchmark_selector,
         pn.Spacer(height=20),
         pn.layout.Divider(),
         pn.pane.Markdown("#### Date Range"),
-        date_slider,
+        w.date_slider,
+        w.date_presets,
         pn.Spacer(height=20),
         pn.layout.Divider(),
         pn.Spacer(height=20),
@@ -43,13 +45,15 @@ def create_sidebar():
     - **YoY %**: Year-over-Year % change
     """, styles={"font-size": "13px", "color": "#555"}),
         pn.Spacer(height=20),
-        change_mode,        
+        w.change_mode,        
         pn.Spacer(height=20),
         pn.layout.Divider(),
         pn.Spacer(height=20),
-        download_selector,
+        w.download_selector,
+        w.export_format,
+        w.export_compression,
         pn.Spacer(height=20),
-        file_download    
+        w.export_link
     )
     return sidebar
 
@@ -57,7 +61,7 @@ def create_dashboard(sidebar_layout, main_layout, title, nav_bar_color='#bfc1c2'
     # Create a layout that combines the main layout with the dynamic cards
     combined_main = [pn.Column(
         *main_layout,
-        create_layout,
+        create_layout(),
        
     )]
     
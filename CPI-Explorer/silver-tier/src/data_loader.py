@@ -1,175 +1,270 @@
+import asyncio
+import datetime as dt
+import json
 import logging
-from time import sleep
+import threading
+import time
 import panel as pn
 import polars as pl
-import pandas as pd
 from pathlib import Path
+from tornado.web import RequestHandler
+from .alignment import period_start, resample
+from .catalog import series_catalog
 from .config import Settings
+from .corr_engine import build_correlation_index
+from .correlation_cube import load_cube, register, save_cube
+from .data_processor import build_correlation_cube
+from .data_store import load_cached
+from .memo import carry_over, results_cache
+from .series_index import build_series_index, compact_frame
+from .session import shared_data
+from .sources import adapter_spec, scan_source, source_key
 
 
 logger = logging.getLogger("app_logger")
 
-__all__ = []
+__all__ = ["load_initial_data", "load_in_background", "loading_status", "refresh_data", "schedule_refresh", "HealthHandler"]
 
-def _data_preprocessor(df: pl.DataFrame, country: str, category: str):
-    date_col = df.columns[0] if df.columns[0].lower() in {"date", "observation_date"} else "DATE"
-    df = (
-        df.rename({df.columns[1]: "value"})
-        .with_columns(
-            pl.col(date_col).str.strptime(pl.Date, "%Y-%m-%d").alias("date"),
-            pl.lit(country).alias("country"),
-            pl.lit(category).alias("category")
-        )
-        .select(["date", "country", "category", "value"])
-    )
-    return df
+# Progress of the initial load, reported by the health endpoint and waiting sessions
+loading_status = {"state": "pending", "started": None, "finished": None, "errors": [], "refreshed": None}
+# One refresh at a time, whether scheduled or called directly
+_refresh_lock = threading.Lock()
 
-def _load_series(file: str, country: str, category: str, need_adj: bool = False):    
-    try:
-        df = pl.read_csv(Settings.DATA_FOLDER.joinpath(file))        
-    except FileNotFoundError as e:
-        logger.error(f"Failed to load {file} data: {e}")
-        pn.state.cache["error_msg"].append(f"Failed to load {file} data: {e}")
-    else:
-        df = _data_preprocessor(df, country, category)
-        if need_adj:
-            scale_factor = (
-                100 / df.filter(pl.col("date").dt.year() == Settings.BASE_YEAR)
-                        .get_column("value")
-                        .median()
-            )
-            # 2. Apply scaling to all values
-            df = df.with_columns(
-                (pl.col("value") * scale_factor).round(1).alias("value")
-            )    
-        pn.state.cache[category] = df
-
-def _downloader(files_meta_dict):
-    for series_name, f_name in files_meta_dict:        
-        logger.debug("Start downloading {f_name} for {series_name}")
-        try:
-            df = pl.read_csv(f"{Settings.FRED_BASE_URL}{f_name}")
-        except Exception as ex:
-            logger.error(f"Error downloading {f_name} for {series_name}")
-            pn.state.cache["error_msg"].append(f"Error downloading {f_name} for {series_name}")
-            continue
-        logger.debug(f"{f_name} for {series_name} downloaded successfully")
-        country,category = series_name.split('_')
-        df = _data_preprocessor(df, country, category)
-        pn.state.cache[series_name] = df
-        
-def _load_fao_series(file: str, country: str, category: str, need_adj: bool = False) -> pl.DataFrame:
+def _load_source(source: dict, path: Path = None) -> pl.DataFrame | None:
+    """Scan one configured source through its adapter, None if it failed to load."""
+    path = path or Settings.DATA_FOLDER.joinpath(source["file"])
     try:
-        pdf = pd.read_csv(Settings.DATA_FOLDER.joinpath(file), header=2, usecols=range(7))
-        df = pl.from_pandas(pdf).filter(pl.col("Date").is_not_null())
+        return scan_source(source, path).collect()
     except Exception as e:
-        logger.error(f"Failed to load FAO data: {e}")
-        pn.state.cache["error_msg"].append(f"Failed to load FAO data: {e}")    
-    else:    
-        df = (
-            df
-            .rename({"Date": "date", "Food Price Index": "value"})
-            .with_columns([
-                pl.col("date").str.strptime(pl.Date, "%Y-%m"),
-                pl.lit(country).alias("country"),
-                pl.lit(category).alias("category")
-            ])
-            .select(["date", "country", "category", "value"])
-        )
-        if need_adj:
-            scale = 100 / df.filter(pl.col("date").dt.year() == Settings.BASE_YEAR).get_column("value").median()
-            df = df.with_columns((pl.col("value") * scale).round(1).alias("value"))
-        pn.state.cache[category] = df
+        logger.error(f"Failed to load {path.name} data: {e}")
+        pn.state.cache["error_msg"].append(f"Failed to load {path.name} data: {e}")
+        return None
 
-def _load_ecb_food_commodity_index(file: str, country: str = "EU (ECB)", category: str = "ECB Food Commodity Index", need_adj: bool = False) -> pl.DataFrame:
+def _downloader(sources, only_changed: bool = False) -> dict:
+    """Fetch the sources that have a series_id, one batch per adapter, and load them.
 
-    # ECB CSVs typically have metadata at the top; autodetect real header
-    try:
-        pdf = pd.read_csv(
-            Settings.DATA_FOLDER.joinpath(file),
-            skiprows=0  # Adjust manually if metadata lines exist
-        )
-    except Exception as e:
-        logging.error(f"Failed to load ECB data: {e}")   
-        pn.state.cache["error_msg"].append(f"Failed to load ECB data: {e}")      
-    else:
-        # Rename & clean
-        if 'TIME_PERIOD' not in pdf.columns or 'OBS_VALUE' not in pdf.columns:
-            raise ValueError("Unexpected ECB format — expected 'TIME_PERIOD' and 'OBS_VALUE' columns")
-        df = (
-            pl.from_pandas(pdf[["TIME_PERIOD", "OBS_VALUE"]])
-            .rename({"TIME_PERIOD": "date", "OBS_VALUE": "value"})
-            .with_columns([
-                pl.col("date").str.strptime(pl.Date, "%Y-%m"),
-                pl.lit(country).alias("country"),
-                pl.lit(category).alias("category"),
-                pl.col("value").cast(pl.Float64)
-            ])
-            .select(["date", "country", "category", "value"])
-            .filter(pl.col("value").is_not_null())
-        )
-        # Normalize to 2015 = 100
-        if need_adj:
-            base_median = (
-                df.filter(pl.col("date").dt.year() == Settings.BASE_YEAR)
-                .get_column("value").median()
-            )
-            df = df.with_columns(
-                (pl.col("value") * (100 / base_median)).round(1).alias("value")
-            )
-        pn.state.cache[category] = df
+    Returns the loaded frames by pn.state.cache slot. With only_changed,
+    series the source reports unchanged or cannot reach are left out.
+    """
+    frames = {}
+    batches = {}
+    for source in sources:
+        batches.setdefault(source["adapter"], []).append(source)
+    for adapter, batch in batches.items():
+        fetched = adapter_spec(batch[0])["fetch"]([source["series_id"] for source in batch])
+        for source in batch:
+            series_id, series_name = source["series_id"], source_key(source)
+            path, status = fetched[series_id]
+            if path is None:
+                logger.error(f"Error downloading {series_id} for {series_name}")
+                pn.state.cache["error_msg"].append(f"Error downloading {series_id} for {series_name}")
+                continue
+            if status == "offline":
+                logger.warning(f"{adapter} unreachable, using local copy of {series_id} for {series_name}")
+            else:
+                logger.debug(f"{series_id} for {series_name} {status}")
+            if only_changed and status != "downloaded":
+                continue
+            if (df := _load_source(source, path)) is not None:
+                frames[series_name] = df
+    return frames
 
 def _data_merger():
     
     data = []
     cats = []
-    for cat, df in pn.state.cache.items():
+    for cat, df in list(pn.state.cache.items()):
         if cat != "error_msg" and isinstance(df, pl.DataFrame):
-            data.append(df)
+            # Staged sources are dropped here, the merged frame is what gets shared
+            data.append(pn.state.cache.pop(cat))
             cats.append(cat)
 
     try:
-        merged_df = pl.concat(data)
+        merged_df = compact_frame(pl.concat(data))
         if merged_df.is_empty():
             raise ValueError("No input data !\nAbort !")
     except Exception as ex:
         logger.error(f"Error loading data!\n{ex} \nAbort !")
         pn.state.cache["error_msg"].append(f"Error loading data!\n{ex} \nAbort !")
     else:
-        error_msg = pn.state.cache["error_msg"]
-        pn.state.cache.clear()
-        pn.state.cache["error_msg"] = error_msg
-        pn.state.cache["full_raw_data"] = merged_df
-        pn.state.cache["categories"] = sorted(set(Settings.BENCHMARK_CATEGORIES).intersection(set(cats)))
-        dates = (
-            merged_df
-            .filter(pl.col("country").is_in(Settings.COUNTRIES))
-            .with_columns(
-                pl.col("date").min().over("country").alias("min_date"),
-                pl.col("date").max().over("country").alias("max_date"),
-            )
-            .with_columns(
-                pl.col("min_date").max().alias("max_min_date"),
-                pl.col("max_date").min().alias("min_max_date"),
-            )            
-            .unique(["max_min_date","min_max_date"])
-            .select("max_min_date","min_max_date")
+        _publish(merged_df, sorted(set(series_catalog().benchmark_categories).intersection(set(cats))))
+
+def _publish(native_df: pl.DataFrame, categories: list):
+    """Publish a merged frame and its indexes as the new shared snapshot.
+
+    native_df keeps every series at the frequency it came in; full_raw_data,
+    which the correlations and plots read, is its resampling to
+    Settings.ANALYSIS_FREQUENCY.
+    """
+    merged_df = resample(native_df, Settings.ANALYSIS_FREQUENCY)
+    series_index = build_series_index(merged_df)
+    dates = (
+        merged_df
+        .filter(pl.col("country").is_in(series_catalog().countries))
+        .with_columns(
+            pl.col("date").min().over("country").alias("min_date"),
+            pl.col("date").max().over("country").alias("max_date"),
         )
-        pn.state.cache["min_date"] = dates["max_min_date"][0]
-        pn.state.cache["max_date"] = dates["min_max_date"][0]
+        .with_columns(
+            pl.col("min_date").max().alias("max_min_date"),
+            pl.col("max_date").min().alias("min_max_date"),
+        )            
+        .unique(["max_min_date","min_max_date"])
+        .select("max_min_date","min_max_date")
+    )
+    shared_data.publish(
+        native_data=native_df,
+        native_index=build_series_index(native_df),
+        full_raw_data=merged_df,
+        series_index=series_index,
+        categories=categories,
+        min_date=dates["max_min_date"][0],
+        max_date=dates["min_max_date"][0],
+        correlation_index=build_correlation_index(merged_df, categories),
+    )
+    prepare_correlation_cube(shared_data.current)
+
+def _build_cube(data):
+    start = time.perf_counter()
+    try:
+        correlations, rolling = build_correlation_cube(data)
+        register(data, save_cube(data, correlations, rolling))
+    except Exception:
+        logger.exception("Building the correlation cube failed, correlations are computed live")
+        return
+    logger.info(f"Correlation cube built in {time.perf_counter() - start:.2f}s")
+
+def prepare_correlation_cube(data) -> threading.Thread:
+    """Serve the snapshot's stored correlation cube, building it in the background if missing."""
+    if not Settings.CORRELATION_CUBE:
+        return None
+    cube = load_cube(data)
+    if cube is not None:
+        register(data, cube)
+        logger.debug("Correlation cube served from the cache folder")
+        return None
+    # Live computation serves every view until the cube is in
+    thread = threading.Thread(target=_build_cube, args=(data,), name="correlation-cube", daemon=True)
+    thread.start()
+    return thread
             
 def load_initial_data():
     try:
-        pn.state.cache.clear()
         pn.state.cache["error_msg"] = []
     except AttributeError:
         logger.error('Cache miss')    
-    _downloader(Settings.CPI_FILES.items())
-    _load_series(Settings.BRENT_FILE, "Global (Oil)", "Brent-Oil", need_adj=True)
-    _load_series(Settings.TY10_FILE, "USA", "10-Year TY", need_adj=True)
-    _load_series(Settings.USDEUR_SPOT_FILE, "Global (USD/EUR)", "USD/EUR Spot", need_adj=True)
-    _load_fao_series(Settings.FAO_FOOD_FILE, "Global (FAO)", "Food Price Index", need_adj=True)
-    _load_ecb_food_commodity_index(Settings.ECB_FODD_INDEX_FILE)
-    _data_merger()        
-    
-load_initial_data()
\ No newline at end of file
+    sources = series_catalog().sources()
+    frames = _downloader([source for source in sources if "series_id" in source])
+    for source in sources:
+        if "series_id" not in source:
+            frames[source_key(source)] = load_cached(_load_source, source)
+    pn.state.cache.update((key, df) for key, df in frames.items() if df is not None)
+    _data_merger()
+
+def _load_and_report():
+    loading_status.update(state="loading", started=time.time(), finished=None, errors=[])
+    try:
+        load_initial_data()
+    except Exception as ex:
+        logger.exception("Initial data load failed")
+        pn.state.cache.setdefault("error_msg", []).append(f"Error loading data!\n{ex} \nAbort !")
+    loading_status.update(
+        state="ready" if shared_data.current is not None else "failed",
+        finished=time.time(),
+        errors=list(pn.state.cache.get("error_msg", [])),
+    )
+    logger.info(f"Initial data load {loading_status['state']} in {loading_status['finished'] - loading_status['started']:.2f}s")
+
+def load_in_background() -> threading.Thread:
+    """Load and publish the data on a worker thread so the server can start serving at once."""
+    thread = threading.Thread(target=_load_and_report, name="initial-data-load", daemon=True)
+    thread.start()
+    return thread
+
+def _last_dates(data) -> dict:
+    """(country, category) -> last native date of each series, read off the series index."""
+    dates = data["native_data"].get_column("date")
+    return {pair: dates[start + length - 1] for pair, (start, length) in data["native_index"].items()}
+
+def refresh_data() -> dict:
+    """Publish the observations newer than each series' last date as a new snapshot.
+
+    Only sources that changed are read again: downloads the source reports
+    modified and files the series store sees changed. Results the new rows
+    cannot affect are carried over to the new snapshot, and sessions move
+    onto it by themselves. Returns the new row count per (country, category).
+    """
+    with _refresh_lock:
+        data = shared_data.current
+        if data is None:
+            return {}
+        pn.state.cache.setdefault("error_msg", [])
+        sources = series_catalog().sources()
+        frames = _downloader([source for source in sources if "series_id" in source], only_changed=True)
+        for source in sources:
+            if "series_id" not in source:
+                frames[source_key(source)] = load_cached(_load_source, source, only_changed=True)
+
+        last_dates = _last_dates(data)
+        fresh, changed, counts = [], {}, {}
+        for source in sources:
+            df = frames.get(source_key(source))
+            if df is None:
+                continue
+            pair = (source["country"], source["category"])
+            if pair in last_dates:
+                df = df.filter(pl.col("date") > last_dates[pair])
+            if not df.is_empty():
+                fresh.append(df)
+                # The period of the first new row is re-aggregated
+                changed[pair] = period_start(df.get_column("date").min())
+                counts[pair] = df.height
+        loading_status["refreshed"] = time.time()
+        if not fresh:
+            logger.info("Data refresh: no new observations")
+            return {}
+
+        merged_df = compact_frame(pl.concat([
+            data["native_data"].cast({"country": pl.String, "category": pl.String, "value": pl.Float64}),
+            *fresh,
+        ]))
+        present = set(merged_df.get_column("category").unique().to_list())
+        _publish(merged_df, sorted(set(series_catalog().benchmark_categories).intersection(present)))
+        kept = carry_over(results_cache, data["version"], shared_data.current["version"], changed)
+        logger.info(
+            f"Data refresh: {sum(counts.values())} new observations in {len(counts)} series, "
+            f"{kept} cached results carried over"
+        )
+        return counts
+
+async def scheduled_refresh():
+    """The scheduler's refresh task; the fetching and merging run on a worker thread."""
+    try:
+        await asyncio.to_thread(refresh_data)
+    except Exception:
+        logger.exception("Scheduled data refresh failed")
+
+def schedule_refresh():
+    """Run the data refresh every Settings.REFRESH_PERIOD, the first one period from now."""
+    if not Settings.REFRESH_PERIOD:
+        return
+    pn.state.schedule_task(
+        "data-refresh", scheduled_refresh,
+        period=Settings.REFRESH_PERIOD, at=dt.datetime.now() + Settings.REFRESH_PERIOD,
+    )
+
+class HealthHandler(RequestHandler):
+    """Readiness probe: 200 once data is published, 503 while loading or after a failed load."""
+
+    def get(self):
+        data = shared_data.current
+        self.set_status(200 if data is not None else 503)
+        self.set_header("Content-Type", "application/json")
+        self.write(json.dumps({
+            "status": "ready" if data is not None else loading_status["state"],
+            "data_version": data["version"] if data is not None else None,
+            "loading_started": loading_status["started"],
+            "loading_finished": loading_status["finished"],
+            "last_refresh": loading_status["refreshed"],
+            "errors": loading_status["errors"],
+        }))
@@ -1,107 +1,111 @@
 import polars as pl
-import panel as pn
 
+from .alignment import months_to_periods, shift_periods
+from .compute_pool import pool_enabled, pooled_correlations, pooled_rolling_correlation
+from .catalog import series_catalog
 from .config import Settings
-from .widgets import *
+from .corr_engine import _mode_transform, _mode_value, _to_wide, _calc_mode_correlations, _correlation_frame, lag_correlations, lag_spearman
+from .correlation_cube import cpi_combinations, cube_correlations, cube_rolling, window_spans
+from .memo import memoize, reads_nothing, results_cache
+from .series_index import select_series
+from .session import session_state
 
-__all__ = ['calc_correlations','compute_rolling_correlation','calc_min_max_correlations']
+__all__ = [
+    'calc_correlations','compute_rolling_correlation','calc_min_max_correlations','transform_selection','rolling_correlation',
+    'calc_lag_correlations','selection_lag_correlations','peak_lags'
+    ]
 
+# Correlations read every series up to the end of the range
+@memoize(results_cache, scope=lambda date_range: (None, date_range[1]))
 def calc_correlations(date_range: tuple):
-    
-    df = pn.state.cache["full_raw_data"]
-    cpi_categories = Settings.CPI_CATEGORIES
-    benchmarks = pn.state.cache["categories"]
+    data = session_state().data
+    # Standard windows are a lookup in the precomputed cube
+    cached = cube_correlations(data, date_range)
+    if cached is not None:
+        return cached
+    return _calc_correlations(data, date_range)
 
-    results = []
+def _calc_correlations(data, date_range: tuple) -> pl.DataFrame:
+    df, index = data["full_raw_data"], data["series_index"]
+    benchmarks = data["categories"]
+    cpi_key = pl.concat_str(["country", "category"], separator="||")
 
-    for country in Settings.COUNTRIES:
-        for cpi_cat in cpi_categories:
-            for mode in ["Index", "MoM %", "YoY %"]:
-                cpi_raw = (
-                    df
-                    .filter(
-                        (pl.col("country") == country) & 
-                        (pl.col("category") == cpi_cat)&
-                        (pl.col("date") >= date_range[0]) &
-                        (pl.col("date") <= date_range[1])
-                    )
-                    .sort("date")
-                )
-                if cpi_raw.is_empty():
-                    continue
-
-                if mode == "MoM %":
-                    cpi_raw = cpi_raw.with_columns(
-                        pl.col("value").pct_change().over(["country", "category"]).alias("value")
-                    )
-                elif mode == "YoY %":
-                    cpi_raw = cpi_raw.with_columns(
-                        (
-                            pl.col("value") / pl.col("value").shift(12) - 1
-                        ).over(["country", "category"]).alias("value")
-                    )
-
-                cpi_base = cpi_raw.select(["date", pl.col("value").alias("cpi_val")])
-                cpi_ema3 = cpi_raw.with_columns(pl.col("value").ewm_mean(span=3).alias("cpi_ema3")).select(["date", "cpi_ema3"])
-                cpi_ema6 = cpi_raw.with_columns(pl.col("value").ewm_mean(span=6).alias("cpi_ema6")).select(["date", "cpi_ema6"])
-
-                for bench in benchmarks:
-                    bench_raw = df.filter(pl.col("category") == bench).sort("date")
-                    if bench_raw.is_empty():
-                        continue
+    catalog = series_catalog()
+    cpi_pairs = [pair for pair in catalog.cpi_pairs if pair in index]
+    cpi_raw = select_series(df, index, cpi_pairs, date_range)
+    bench_pairs = [pair for pair in catalog.pairs_of(benchmarks) if pair in index]
+    present = set(cpi_raw.select(cpi_key).to_series())
+    cpi_keys = [key for key in catalog.cpi_keys if key in present]
 
-                    if mode == "MoM %":
-                        bench_raw = bench_raw.with_columns(
-                            pl.col("value").pct_change().over(["country", "category"]).alias("value")
-                        )
-                    elif mode == "YoY %":
-                        bench_raw = bench_raw.with_columns(
-                            (
-                                pl.col("value") / pl.col("value").shift(12) - 1
-                            ).over(["country", "category"]).alias("value")
-                        )
-
-                    bench_base = bench_raw.select(["date", pl.col("value").alias("bench_val")])
-                    bench_ema3 = bench_raw.with_columns(pl.col("value").ewm_mean(span=3).alias("bench_ema3")).select(["date", "bench_ema3"])
-                    bench_ema6 = bench_raw.with_columns(pl.col("value").ewm_mean(span=6).alias("bench_ema6")).select(["date", "bench_ema6"])
-
-                    joined = (
-                        cpi_base.join(bench_base, on="date", how="inner")
-                        .join(cpi_ema3, on="date", how="inner")
-                        .join(bench_ema3, on="date", how="inner")
-                        .join(cpi_ema6, on="date", how="inner")
-                        .join(bench_ema6, on="date", how="inner")
-                        .drop_nulls()
-                    )
-
-                    if joined.height < 2:
-                        continue
+    if pool_enabled():
+        by_mode = pooled_correlations(data, date_range, cpi_pairs, cpi_keys, bench_pairs, benchmarks)
+        return _correlation_frame(by_mode, cpi_keys, benchmarks)
+
+    bench_raw = select_series(df, index, bench_pairs)
+    by_mode = {}
+    for mode in Settings.MODES:
+        cpi_wide = _to_wide(_mode_transform(cpi_raw, mode), cpi_key)
+        bench_wide = _to_wide(_mode_transform(bench_raw, mode), pl.col("category"))
+        by_mode[mode] = _calc_mode_correlations(cpi_wide, bench_wide, cpi_keys, benchmarks)
+
+    return _correlation_frame(by_mode, cpi_keys, benchmarks)
+
+# Leads reach Settings.LAG_MAX months past the end of the range
+@memoize(results_cache, scope=lambda date_range: (None, shift_periods(date_range[1], months_to_periods(Settings.LAG_MAX))))
+def calc_lag_correlations(date_range: tuple) -> pl.DataFrame:
+    """Pearson of every CPI x benchmark pair and mode at each lag, for the CPI over date_range."""
+    data = session_state().data
+    df, index = data["full_raw_data"], data["series_index"]
+    catalog = series_catalog()
+    cpi_raw = select_series(df, index, [pair for pair in catalog.cpi_pairs if pair in index], date_range)
+    bench_raw = select_series(df, index, [pair for pair in catalog.pairs_of(data["categories"]) if pair in index])
+    present = set(cpi_raw.select(pl.concat_str(["country", "category"], separator="||")).to_series())
+    cpi_keys = [key for key in catalog.cpi_keys if key in present]
+    return lag_correlations(cpi_raw, bench_raw, cpi_keys, data["categories"])
 
-                    def corr(col1, col2):
-                        return joined.select(pl.corr(col1, col2)).item()
-
-                    def spearman(col1, col2):
-                        ranked = joined.with_columns([
-                            pl.col(col1).rank().alias("rank1"),
-                            pl.col(col2).rank().alias("rank2")
-                        ])
-                        return ranked.select(pl.corr("rank1", "rank2")).item()
-
-                    results.append({
-                        "country": country,
-                        "CPI": cpi_cat,
-                        "benchmark": bench,
-                        "mode": mode,
-                        "Pearson": round(corr("cpi_val", "bench_val"), 3),
-                        "Pearson (EMA3)": round(corr("cpi_ema3", "bench_ema3"), 3),
-                        "Pearson (EMA6)": round(corr("cpi_ema6", "bench_ema6"), 3),
-                        "Spearman": round(spearman("cpi_val", "bench_val"), 3),
-                        "Spearman (EMA3)": round(spearman("cpi_ema3", "bench_ema3"), 3),
-                        "Spearman (EMA6)": round(spearman("cpi_ema6", "bench_ema6"), 3)
-                    })
-
-    return pl.DataFrame(results)
+def _lag_selection_scope(country, cpi, date_range, mode) -> tuple:
+    catalog = series_catalog()
+    pairs = [(country, cat) for cat in cpi] + catalog.pairs_of(catalog.benchmark_categories)
+    return pairs, shift_periods(date_range[1], months_to_periods(Settings.LAG_MAX))
 
+@memoize(results_cache, scope=_lag_selection_scope)
+def selection_lag_correlations(country: str, cpi: list, date_range: tuple, mode: str) -> pl.DataFrame:
+    """calc_lag_correlations rows of the selected CPI in mode, with Spearman ranked over each lag's overlap."""
+    lag_df = calc_lag_correlations(date_range)
+    if lag_df.is_empty():
+        return pl.DataFrame()
+    lag_df = lag_df.filter((pl.col("country") == country) & pl.col("CPI").is_in(cpi) & (pl.col("mode") == mode))
+    data = session_state().data
+    df, index = data["full_raw_data"], data["series_index"]
+    cpi_pairs = [(country, cat) for cat in cpi if (country, cat) in index]
+    bench_pairs = [pair for pair in series_catalog().pairs_of(data["categories"]) if pair in index]
+    spearman = lag_spearman(
+        select_series(df, index, cpi_pairs, date_range), select_series(df, index, bench_pairs),
+        [f"{country}||{cat}" for cat in cpi if (country, cat) in index], data["categories"], mode,
+    )
+    if spearman.is_empty():
+        return lag_df.with_columns(pl.lit(None, pl.Float64).alias("Spearman"))
+    return lag_df.join(spearman, on=["country", "CPI", "benchmark", "lag"], how="left").select(
+        "country", "CPI", "benchmark", "mode", "lag", "Pearson", "Spearman", "observations"
+    )
+
+@memoize(results_cache, scope=reads_nothing)
+def peak_lags(lag_df: pl.DataFrame) -> pl.DataFrame:
+    """Per CPI, benchmark and correlation type of a selection_lag_correlations frame, the lag of the largest absolute correlation."""
+    if lag_df.is_empty():
+        return pl.DataFrame()
+    return (
+        lag_df
+        .unpivot(index=["CPI", "benchmark", "lag"], on=["Pearson", "Spearman"], variable_name="correlation_type", value_name="correlation")
+        .drop_nulls("correlation")
+        .sort(pl.col("correlation").abs(), descending=True)
+        .group_by("CPI", "benchmark", "correlation_type", maintain_order=True)
+        .first()
+        .rename({"lag": "peak_lag", "correlation": "peak_correlation"})
+        .sort("correlation_type", pl.col("peak_correlation").abs(), descending=[False, True])
+    )
+
+@memoize(results_cache, scope=reads_nothing)
 def calc_min_max_correlations(correlation_df, country, cpi, mode):
     df = (
         correlation_df
@@ -152,47 +156,101 @@ def calc_min_max_correlations(correlation_df, country, cpi, mode):
     final_kpi = strongest.join(weakest, on="correlation_type").join(summary, on="correlation_type")
     return final_kpi, df
 
-def compute_rolling_correlation(df: pl.DataFrame, cpi: str, country: str, mode: str, benchmarks: list, window: int = 12):
-    
+def _selection_scope(country, cpi, benchmarks, date_range, mode) -> tuple:
+    return [(country, cat) for cat in cpi] + series_catalog().pairs_of(benchmarks), date_range[1]
+
+@memoize(results_cache, scope=_selection_scope)
+def transform_selection(country: str, cpi: list, benchmarks: list, date_range: tuple, mode: str) -> pl.DataFrame:
+    """The selected CPI and benchmark series, cut to date_range and put in mode.
+
+    Both tabs read this frame, so one widget state filters and transforms the
+    raw data once no matter how many plots consume it.
+    """
+    return _transform_selection(session_state().data, country, cpi, benchmarks, date_range, mode)
+
+def _transform_selection(data, country: str, cpi: list, benchmarks: list, date_range: tuple, mode: str) -> pl.DataFrame:
+    selected_pairs = [(country, cat) for cat in cpi] + series_catalog().pairs_of(benchmarks)
+    return (
+        select_series(data["full_raw_data"], data["series_index"], selected_pairs, date_range)
+        .lazy()
+        .with_columns(_mode_value(mode).over(["country", "category"]).alias("value"))
+        .collect()
+    )
+
+@memoize(results_cache, scope=reads_nothing)
+def compute_rolling_correlation(df: pl.DataFrame, cpi: list, country: str, benchmarks: list, window: int = 12):
+    """Rolling Pearson of the CPI against each benchmark on a transform_selection frame."""
+    if pool_enabled() and len(benchmarks) > 1:
+        results = pooled_rolling_correlation(df, cpi, country, benchmarks, window)
+        return pl.concat(results) if results else pl.DataFrame()
+    return _rolling_correlation(df, cpi, country, benchmarks, window)
+
+def rolling_correlation(country: str, cpi: list, mode: str, date_range: tuple, benchmarks: list, window: int = Settings.ROLLING_WINDOW):
+    """Rolling correlations of a widget state, from the cube for standard windows."""
+    cached = cube_rolling(session_state().data, country, cpi, mode, date_range, benchmarks, window)
+    if cached is not None:
+        return cached
+    df = transform_selection(country, cpi, benchmarks, date_range, mode)
+    return compute_rolling_correlation(df, cpi, country, benchmarks, window)
+
+def build_correlation_cube(data) -> tuple:
+    """calc_correlations and rolling correlations of every standard window, as two long frames.
+
+    Rolling correlations cover all countries, modes and ordered CPI
+    selections, one block of rows per benchmark.
+    """
+    benchmarks = data["categories"]
+    correlations, rolling = [], []
+    # Each window is computed over its span, which selects the same rows
+    for start, end in window_spans(data):
+        window = pl.lit(start).alias("start"), pl.lit(end).alias("end")
+        corr_df = _calc_correlations(data, (start, end))
+        if not corr_df.is_empty():
+            correlations.append(corr_df.select(*window, pl.all()))
+        for country in series_catalog().countries:
+            for mode in Settings.MODES:
+                for cpi in cpi_combinations():
+                    df = _transform_selection(data, country, cpi, benchmarks, (start, end), mode)
+                    r_df = _rolling_correlation(df, cpi, country, benchmarks, Settings.ROLLING_WINDOW)
+                    if r_df.is_empty():
+                        continue
+                    rolling.append(r_df.select(
+                        *window, pl.lit(country).alias("country"), pl.lit(mode).alias("mode"),
+                        pl.lit("||".join(cpi)).alias("cpi"), pl.all(),
+                    ))
+    return pl.concat(correlations), pl.concat(rolling)
+
+def _rolling_correlation(df: pl.DataFrame, cpi: list, country: str, benchmarks: list, window: int):
+    """Rolling Pearson of each selected CPI category against each benchmark, one date-sorted run per pair."""
     cpi_df = (
         df.filter(
             (pl.col("category").is_in(cpi)) & 
             (pl.col("country") == country)
         )
-          .sort("date")
-          .select(["date", "value"])
-          .rename({"value": "cpi_value"})
+          .select(["date", "category", "value"])
+          .rename({"category": "CPI", "value": "cpi_value"})
     )
-
-    if mode == "MoM %":
-        cpi_df = cpi_df.with_columns(
-            pl.col("cpi_value").pct_change().alias("cpi_value")
-        )
-    elif mode == "YoY %":
-        cpi_df = cpi_df.with_columns(
-            (pl.col("cpi_value") / pl.col("cpi_value").shift(12) - 1).alias("cpi_value")
-        )
+    # Blocks follow the selection order
+    order = pl.col("CPI").replace_strict(cpi, list(range(len(cpi))), return_dtype=pl.Int64)
 
     results = []
     for benchmark in benchmarks:
-        bdf = df.filter(pl.col("category") == benchmark).sort("date")
+        bdf = df.filter(pl.col("category") == benchmark)
         bdf = bdf.select(["date", "value"]).rename({"value": "bench_val"})
 
-        if mode == "MoM %":
-            bdf = bdf.with_columns(pl.col("bench_val").pct_change().alias("bench_val"))
-        elif mode == "YoY %":
-            bdf = bdf.with_columns((pl.col("bench_val") / pl.col("bench_val").shift(12) - 1).alias("bench_val"))
-
         joined = (
             cpi_df.join(bdf, on="date", how="inner")
                   .drop_nulls()
+                  .filter(pl.len().over("CPI") >= window)
+                  .sort(order, "date")
         )
-        if joined.height < window:
+        if joined.is_empty():
             continue
 
         rolling_corr = joined.select([
             pl.col("date"),
-            pl.rolling_corr(pl.col("cpi_value"),pl.col("bench_val"), window_size=window).alias("rolling_corr")
+            pl.col("CPI"),
+            pl.rolling_corr(pl.col("cpi_value"),pl.col("bench_val"), window_size=window).over("CPI").alias("rolling_corr")
         ]).with_columns([
             pl.lit(benchmark).alias("benchmark")
         ])
@@ -200,4 +258,3 @@ def compute_rolling_correlation(df: pl.DataFrame, cpi: str, country: str, mode:
         results.append(rolling_corr)
 
     return pl.concat(results) if results else pl.DataFrame()
-
@@ -0,0 +1,103 @@
+import hashlib
+import json
+import logging
+import polars as pl
+from pathlib import Path
+from .config import Settings
+from .sources import source_params
+
+
+logger = logging.getLogger("app_logger")
+
+__all__ = []
+
+# Bump when the normalized layout or the loaders' output changes
+STORE_VERSION = 2
+MANIFEST_FILE = "manifest.json"
+
+def _file_hash(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _read_manifest() -> dict:
+    try:
+        manifest = json.loads(Settings.CACHE_FOLDER.joinpath(MANIFEST_FILE).read_text())
+    except (OSError, ValueError):
+        return {}
+    return manifest if manifest.get("version") == STORE_VERSION else {}
+
+def _write_manifest(manifest: dict):
+    manifest["version"] = STORE_VERSION
+    Settings.CACHE_FOLDER.joinpath(MANIFEST_FILE).write_text(json.dumps(manifest, indent=2))
+
+def _entry_params(loader, source: dict) -> dict:
+    return {"loader": loader.__name__, **source_params(source)}
+
+def _is_fresh(entry: dict, path: Path, params: dict) -> bool:
+    """Check a manifest entry against the source file (mtime first, then hash)."""
+    if not entry or entry.get("params") != params:
+        return False
+    if not Settings.CACHE_FOLDER.joinpath(entry["store_file"]).exists():
+        return False
+    stat = path.stat()
+    if entry.get("mtime_ns") == stat.st_mtime_ns and entry.get("size") == stat.st_size:
+        return True
+    if entry.get("sha256") != _file_hash(path):
+        return False
+    # Touched but unchanged: remember the new mtime so we skip hashing next time
+    entry["mtime_ns"], entry["size"] = stat.st_mtime_ns, stat.st_size
+    return True
+
+def load_cached(loader, source: dict, only_changed: bool = False) -> pl.DataFrame | None:
+    """Serve a normalized source from the IPC store, running loader only if it changed.
+
+    The loader returns the normalized frame, or None when the source failed
+    to load; store hits are memory-mapped. With only_changed a source the
+    store holds unchanged returns None instead.
+    """
+    file = source["file"]
+    path = Settings.DATA_FOLDER.joinpath(file)
+    if not path.exists():
+        return loader(source)
+
+    params = _entry_params(loader, source)
+    manifest = _read_manifest()
+    sources = manifest.setdefault("sources", {})
+    entry = sources.get(file, {})
+    seen = dict(entry)
+    try:
+        if _is_fresh(entry, path, params):
+            if entry != seen:
+                _write_manifest(manifest)
+            if only_changed:
+                return None
+            logger.debug(f"{file} served from the series store")
+            return pl.read_ipc(Settings.CACHE_FOLDER.joinpath(entry["store_file"]), memory_map=True)
+    except OSError as ex:
+        logger.warning(f"Series store unreadable for {file}: {ex}")
+
+    df = loader(source)
+    if not isinstance(df, pl.DataFrame):
+        return None
+    stat = path.stat()
+    store_file = f"{path.stem}.arrow"
+    try:
+        Settings.CACHE_FOLDER.mkdir(parents=True, exist_ok=True)
+        # Replaced, not rewritten in place: frames read earlier may still map the old file
+        part = Settings.CACHE_FOLDER.joinpath(f"{store_file}.part")
+        df.write_ipc(part, compression="uncompressed")
+        part.replace(Settings.CACHE_FOLDER.joinpath(store_file))
+        sources[file] = {
+            "store_file": store_file,
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "sha256": _file_hash(path),
+            "params": params,
+        }
+        _write_manifest(manifest)
+    except OSError as ex:
+        logger.warning(f"Could not update the series store for {file}: {ex}")
+    return df
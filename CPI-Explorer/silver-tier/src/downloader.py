@@ -0,0 +1,104 @@
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from time import sleep
+import requests
+from requests.adapters import HTTPAdapter
+from .config import Settings
+
+
+logger = logging.getLogger("app_logger")
+
+__all__ = []
+
+
+def _mirror_paths(series_id: str) -> tuple:
+    mirror = Settings.MIRROR_FOLDER.joinpath(f"{series_id}.csv")
+    return mirror, mirror.with_suffix(".json")
+
+
+def _validators(mirror: Path, meta_path: Path) -> dict:
+    """Conditional GET headers from the last successful download, if any."""
+    if not mirror.exists():
+        return {}
+    try:
+        meta = json.loads(meta_path.read_text())
+    except (OSError, ValueError):
+        return {}
+    headers = {}
+    if meta.get("etag"):
+        headers["If-None-Match"] = meta["etag"]
+    if meta.get("last_modified"):
+        headers["If-Modified-Since"] = meta["last_modified"]
+    return headers
+
+
+def _save_mirror(mirror: Path, meta_path: Path, response: requests.Response):
+    mirror.parent.mkdir(parents=True, exist_ok=True)
+    tmp = mirror.with_suffix(".part")
+    tmp.write_bytes(response.content)
+    tmp.replace(mirror)
+    meta_path.write_text(json.dumps({
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+    }))
+
+
+def _offline_copy(series_id: str, mirror: Path) -> Path | None:
+    if mirror.exists():
+        return mirror
+    bundled = Settings.DATA_FOLDER.joinpath(f"{series_id}.csv")
+    return bundled if bundled.exists() else None
+
+
+def _retryable(status: int) -> bool:
+    """Server errors and rate limiting are worth another attempt, other client errors are not."""
+    return status >= 500 or status == 429
+
+
+def _fetch(session: requests.Session, series_id: str) -> tuple:
+    """Revalidate one series against FRED, retrying within its own budget.
+
+    Returns (path, status) where status is "downloaded", "not-modified" or
+    "offline"; path is None when no copy of the series is available at all.
+    """
+    mirror, meta_path = _mirror_paths(series_id)
+    headers = _validators(mirror, meta_path)
+    for attempt in range(Settings.FRED_RETRIES + 1):
+        try:
+            response = session.get(
+                f"{Settings.FRED_BASE_URL}{series_id}", headers=headers, timeout=Settings.FRED_TIMEOUT
+            )
+            if response.status_code == 304:
+                return mirror, "not-modified"
+            response.raise_for_status()
+            _save_mirror(mirror, meta_path, response)
+            return mirror, "downloaded"
+        except requests.HTTPError as ex:
+            logger.debug(f"Attempt {attempt + 1} for {series_id} failed: {ex}")
+            # A bad series id or request does not get better by asking again
+            if not _retryable(ex.response.status_code):
+                break
+        except (requests.RequestException, OSError) as ex:
+            logger.debug(f"Attempt {attempt + 1} for {series_id} failed: {ex}")
+        if attempt < Settings.FRED_RETRIES:
+            sleep(Settings.FRED_BACKOFF * 2 ** attempt)
+    return _offline_copy(series_id, mirror), "offline"
+
+
+def fetch_fred_series(series_ids: list) -> dict:
+    """Fetch all series concurrently over one pooled session.
+
+    Maps each series id to the (path, status) pair returned by _fetch.
+    """
+    if not series_ids:
+        return {}
+    workers = min(Settings.FRED_WORKERS, len(series_ids))
+    with requests.Session() as session:
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = pool.map(lambda series_id: _fetch(session, series_id), series_ids)
+            return dict(zip(series_ids, results))
@@ -0,0 +1,147 @@
+import datetime as dt
+import secrets
+import weakref
+from urllib.parse import urlencode
+
+import polars as pl
+import pyarrow as pa
+import pyarrow.ipc
+import pyarrow.parquet as pq
+from tornado.ioloop import IOLoop
+from tornado.web import HTTPError, RequestHandler
+
+from .config import Settings
+
+__all__ = ["export_chunks", "export_url", "ExportHandler"]
+
+_EXTENSIONS = {"CSV": ".csv", "Parquet": ".parquet", "Arrow IPC": ".arrow"}
+_CONTENT_TYPES = {
+    "CSV": "text/csv",
+    "Parquet": "application/vnd.apache.parquet",
+    "Arrow IPC": "application/vnd.apache.arrow.file",
+}
+# Codecs a format applies to its own buffers; any other compression wraps the whole stream
+_NATIVE_CODECS = {"CSV": (), "Parquet": ("gzip", "zstd"), "Arrow IPC": ("zstd",)}
+_STREAM_CODECS = {"gzip": (".gz", "application/gzip"), "zstd": (".zst", "application/zstd")}
+
+# export token -> SessionState; entries go away with their session
+_exports = weakref.WeakValueDictionary()
+
+
+class _Drain:
+    """Write-only file collecting encoded bytes until the exporter hands them out."""
+
+    closed = False
+
+    def __init__(self):
+        self._parts = []
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def _compression(fmt: str, compression: str) -> tuple:
+    """(native codec, stream codec) for a format and a requested compression."""
+    if compression in (None, "None"):
+        return None, None
+    if compression in _NATIVE_CODECS[fmt]:
+        return compression, None
+    return None, compression
+
+
+def export_chunks(df: pl.DataFrame, fmt: str = "CSV", compression: str = None, chunk_rows: int = None):
+    """Encode df as fmt, yielding the bytes one slice of rows at a time.
+
+    Only one slice and its encoded bytes are in memory at once. Parquet
+    writes a row group per slice and Arrow IPC a record batch per slice,
+    each with its native codec when it has one; otherwise gzip/zstd
+    compress the byte stream itself.
+    """
+    native, stream_codec = _compression(fmt, compression)
+    drain = _Drain()
+    sink = pa.PythonFile(drain, mode="w")
+    stream = pa.CompressedOutputStream(sink, stream_codec) if stream_codec else sink
+    writer = None
+    for i, chunk in enumerate(df.iter_slices(chunk_rows or Settings.EXPORT_CHUNK_ROWS)):
+        if fmt == "CSV":
+            stream.write(chunk.write_csv(include_header=i == 0).encode("utf-8"))
+        else:
+            table = chunk.to_arrow()
+            if writer is None:
+                if fmt == "Parquet":
+                    writer = pq.ParquetWriter(stream, table.schema, compression=native or "none")
+                else:
+                    writer = pa.ipc.new_file(stream, table.schema, options=pa.ipc.IpcWriteOptions(compression=native))
+            writer.write_table(table)
+        yield drain.drain()
+    if fmt == "CSV" and df.height == 0:
+        stream.write(df.write_csv().encode("utf-8"))
+    if writer is not None:
+        writer.close()
+    stream.close()
+    yield drain.drain()
+
+
+def export_filename(name: str, fmt: str, compression: str = None) -> str:
+    now = dt.datetime.now().replace(second=0, microsecond=0).strftime("%Y-%m-%d_%H-%M")
+    _, stream_codec = _compression(fmt, compression)
+    suffix = _STREAM_CODECS[stream_codec][0] if stream_codec else ""
+    return f"{name}_{now}{_EXTENSIONS[fmt]}{suffix}"
+
+
+def export_url(state, file_: str, fmt: str, compression: str) -> str:
+    """Link that streams one of the session's frames from the export route."""
+    if state.export_token is None:
+        state.export_token = secrets.token_urlsafe(16)
+        _exports[state.export_token] = state
+    query = urlencode({"session": state.export_token, "file": file_, "format": fmt, "compression": compression})
+    return f"{Settings.EXPORT_ROUTE}?{query}"
+
+
+class ExportHandler(RequestHandler):
+    """Streams a session's frame as CSV, Parquet or Arrow IPC, mounted next to the app by `main`.
+
+    Encoding runs on the executor one slice at a time, and each chunk is
+    flushed to the client before the next one is encoded.
+    """
+
+    async def get(self):
+        state = _exports.get(self.get_argument("session", ""))
+        if state is None:
+            raise HTTPError(404, "Unknown or expired session")
+        file_ = self.get_argument("file")
+        fmt = self.get_argument("format", "CSV")
+        compression = self.get_argument("compression", "None")
+        if fmt not in _EXTENSIONS or compression not in Settings.EXPORT_COMPRESSIONS:
+            raise HTTPError(400, "Unsupported format or compression")
+        df = state.cache.get(file_, state.data.get(file_) if state.data else None)
+        if not isinstance(df, pl.DataFrame) or df.is_empty():
+            self.set_header("Content-Type", "text/plain")
+            self.set_header("Content-Disposition", 'attachment; filename="empty.csv"')
+            self.write(b"No data")
+            return
+
+        _, stream_codec = _compression(fmt, compression)
+        self.set_header("Content-Type", _STREAM_CODECS[stream_codec][1] if stream_codec else _CONTENT_TYPES[fmt])
+        self.set_header("Content-Disposition", f'attachment; filename="{export_filename(file_, fmt, compression)}"')
+        chunks = export_chunks(df, fmt, compression)
+        loop = IOLoop.current()
+        try:
+            while (chunk := await loop.run_in_executor(None, next, chunks, None)) is not None:
+                if chunk:
+                    self.write(chunk)
+                    await self.flush()
+        finally:
+            chunks.close()
@@ -0,0 +1,182 @@
+import functools
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from io import BytesIO
+
+import numpy as np
+import polars as pl
+from tornado.web import RequestHandler
+
+from .config import Settings
+
+logger = logging.getLogger("app_logger")
+
+__all__ = ["instrument", "track", "track_cache", "metrics", "MetricsHandler"]
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PAYLOAD_BUCKETS = tuple(1024 * 4 ** i for i in range(10))  # 1 KiB .. 256 MiB
+
+
+class _Histogram:
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """Thread-safe per-callback counters and histograms in Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency = {}
+        self.payload = {}
+        self.rows = {}
+        self.calls = {}
+        self.errors = {}
+        self.cache = {}
+        self.caches = {}
+
+    def register_cache(self, name: str, cache):
+        """Export the ``stats()`` of a cache as gauges labelled with ``name``."""
+        self.caches[name] = cache
+
+    def record(self, callback: str, seconds: float, rows: int, payload: int, failed: bool):
+        with self._lock:
+            self.latency.setdefault(callback, _Histogram(LATENCY_BUCKETS)).observe(seconds)
+            self.payload.setdefault(callback, _Histogram(PAYLOAD_BUCKETS)).observe(payload)
+            self.rows[callback] = self.rows.get(callback, 0) + rows
+            self.calls[callback] = self.calls.get(callback, 0) + 1
+            if failed:
+                self.errors[callback] = self.errors.get(callback, 0) + 1
+
+    def record_cache(self, callback: str, function: str, hit: bool):
+        key = (callback, function, "hit" if hit else "miss")
+        with self._lock:
+            self.cache[key] = self.cache.get(key, 0) + 1
+
+    def render(self) -> str:
+        prefix = Settings.METRICS_PREFIX
+        lines = []
+
+        def header(name, kind, doc):
+            lines.append(f"# HELP {prefix}_{name} {doc}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+
+        def histograms(name, doc, series):
+            header(name, "histogram", doc)
+            for callback, hist in sorted(series.items()):
+                cumulative = 0
+                for bound, count in zip((*hist.buckets, "+Inf"), hist.counts):
+                    cumulative += count
+                    lines.append(f'{prefix}_{name}_bucket{{callback="{callback}",le="{bound}"}} {cumulative}')
+                lines.append(f'{prefix}_{name}_sum{{callback="{callback}"}} {hist.sum}')
+                lines.append(f'{prefix}_{name}_count{{callback="{callback}"}} {hist.count}')
+
+        def counters(name, doc, series):
+            header(name, "counter", doc)
+            for callback, value in sorted(series.items()):
+                lines.append(f'{prefix}_{name}{{callback="{callback}"}} {value}')
+
+        with self._lock:
+            histograms("callback_latency_seconds", "Wall time of widget callbacks and plotters.", self.latency)
+            histograms("callback_payload_bytes", "Bytes of frames, arrays and files handed to the view per call.", self.payload)
+            counters("callback_calls_total", "Calls per callback.", self.calls)
+            counters("callback_errors_total", "Calls that raised.", self.errors)
+            counters("callback_rows_total", "Rows in the frames each callback produced or reused.", self.rows)
+            header("memo_lookups_total", "counter", "Memoized computation lookups by outcome.")
+            for (callback, function, outcome), value in sorted(self.cache.items()):
+                lines.append(
+                    f'{prefix}_memo_lookups_total{{callback="{callback}",function="{function}",result="{outcome}"}} {value}'
+                )
+        stats = {name: cache.stats() for name, cache in sorted(self.caches.items())}
+        for name, kind, doc in (
+            ("entries", "gauge", "Results held in the cache."),
+            ("bytes", "gauge", "Estimated size of the cache."),
+            ("evictions", "counter", "Results evicted from the cache."),
+        ):
+            header(f"cache_{name}", kind, doc)
+            for cache, values in stats.items():
+                lines.append(f'{prefix}_cache_{name}{{cache="{cache}"}} {values[name]}')
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+# Samples of the instrumented calls currently running in this context, outermost first
+_active = ContextVar("active_samples", default=())
+
+
+def _measure(value) -> tuple:
+    """(rows, bytes) of a frame, array, file buffer or a container of those."""
+    if isinstance(value, pl.DataFrame):
+        return value.height, value.estimated_size()
+    if isinstance(value, np.ndarray):
+        return len(value), value.nbytes
+    if isinstance(value, BytesIO):
+        return 0, value.getbuffer().nbytes
+    if isinstance(value, (tuple, list)):
+        sizes = [_measure(v) for v in value]
+        return sum(r for r, _ in sizes), sum(b for _, b in sizes)
+    if isinstance(value, dict):
+        return _measure(list(value.values()))
+    return 0, 0
+
+
+def track(value):
+    """Count a frame or buffer against every instrumented call in progress."""
+    rows, payload = _measure(value)
+    for sample in _active.get():
+        sample[0] += rows
+        sample[1] += payload
+    return value
+
+
+def track_cache(function: str, hit: bool):
+    """Count a memo lookup against the innermost instrumented call."""
+    samples = _active.get()
+    metrics.record_cache(samples[-1][2] if samples else "other", function, hit)
+
+
+def instrument(func):
+    """Record latency, rows, payload bytes and errors for each call of ``func``."""
+    name = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        sample = [0, 0, name]
+        token = _active.set(_active.get() + (sample,))
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = func(*args, **kwargs)
+            failed = False
+        finally:
+            _active.reset(token)
+            elapsed = time.perf_counter() - start
+            if not failed:
+                rows, payload = _measure(result)
+                sample[0] += rows
+                sample[1] += payload
+            metrics.record(name, elapsed, sample[0], sample[1], failed)
+            if elapsed > Settings.SLOW_CALLBACK_SECONDS:
+                logger.debug(f"{name} took {elapsed:.3f}s ({sample[0]} rows, {sample[1]} bytes)")
+        return result
+    return wrapper
+
+
+class MetricsHandler(RequestHandler):
+    """Prometheus scrape endpoint, mounted next to the app by `main`."""
+
+    def get(self):
+        self.set_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.write(metrics.render())
@@ -0,0 +1,193 @@
+import functools
+import logging
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict
+import polars as pl
+from .config import Settings
+from .instrumentation import metrics, track, track_cache
+from .session import session_state
+
+
+logger = logging.getLogger("app_logger")
+
+__all__ = ["results_cache", "memoize"]
+
+# qualname -> scope of each memoized computation, see memoize
+_scopes = {}
+
+def _size_of(value) -> int:
+    if isinstance(value, pl.DataFrame):
+        return value.estimated_size()
+    if isinstance(value, (tuple, list)):
+        return sum(_size_of(v) for v in value)
+    return sys.getsizeof(value)
+
+# id of a live frame returned by a memoized call -> (weak reference, key of that call)
+_origins = {}
+_origins_lock = threading.Lock()
+
+def _register(value, key):
+    """Remember key as the identity of the frames in value, a memoized result."""
+    if isinstance(value, (tuple, list)):
+        for i, v in enumerate(value):
+            _register(v, (key, i))
+        return
+    if not isinstance(value, pl.DataFrame):
+        return
+    frame_id = id(value)
+    def forget(_, frame_id=frame_id):
+        with _origins_lock:
+            if _origins.get(frame_id, (None,))[0] is ref:
+                del _origins[frame_id]
+    ref = weakref.ref(value, forget)
+    with _origins_lock:
+        _origins[frame_id] = (ref, key)
+
+def _key_part(value):
+    """Hashable stand-in for an argument.
+
+    A frame returned by a memoized call is keyed by that call's key, which
+    fixes its content; any other frame by its schema and a hash of its rows.
+    """
+    if isinstance(value, pl.DataFrame):
+        with _origins_lock:
+            ref, key = _origins.get(id(value), (None, None))
+        if ref is not None and ref() is value:
+            return ("result", key)
+        # hash_rows borrows the frame mutably; hashing a clone keeps shared frames usable from other threads
+        return (
+            "frame", value.height, tuple((name, str(dtype)) for name, dtype in value.schema.items()),
+            hash(value.clone().hash_rows().to_numpy().tobytes()),
+        )
+    if isinstance(value, (list, tuple)):
+        return tuple(_key_part(v) for v in value)
+    return value
+
+class LRUCache:
+    """Thread-safe LRU cache bounded by entry count, total size and age."""
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl: float):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Return (True, value) on a fresh hit, (False, None) otherwise."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[2] > self.ttl:
+                self._drop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, entry[0]
+
+    def put(self, key, value):
+        size = _size_of(value)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (value, size, time.monotonic())
+            self.total_bytes += size
+            while len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _drop(self, key):
+        _, size, _ = self._entries.pop(key)
+        self.total_bytes -= size
+
+    def items(self) -> list:
+        with self._lock:
+            return [(key, entry[0]) for key, entry in self._entries.items()]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.total_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+results_cache = LRUCache(Settings.MEMO_MAX_ENTRIES, Settings.MEMO_MAX_BYTES, Settings.MEMO_TTL)
+metrics.register_cache("results", results_cache)
+
+def memoize(cache: LRUCache, scope=None):
+    """Memoize a computation on its arguments and the shared data version.
+
+    Results are shared by all sessions looking at the same data snapshot;
+    returned frames must be treated as read-only by callers. scope maps the
+    arguments to the (country, category) pairs the computation reads, None
+    for all of them, and the last date it reads, None for no limit; it lets
+    carry_over keep the result across a data refresh that adds nothing it reads.
+    """
+    def decorator(func):
+        if scope is not None:
+            _scopes[func.__qualname__] = scope
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            data = session_state().data
+            key = (
+                func.__qualname__,
+                data["version"] if data else None,
+                _key_part(args),
+                tuple(sorted((k, _key_part(v)) for k, v in kwargs.items())),
+            )
+            hit, value = cache.get(key)
+            track_cache(func.__name__, hit)
+            if not hit:
+                value = func(*args, **kwargs)
+                cache.put(key, value)
+                _register(value, key)
+            return track(value)
+        return wrapper
+    return decorator
+
+def reads_nothing(*args, **kwargs) -> tuple:
+    """Scope of computations that depend on their arguments only."""
+    return (), None
+
+def carry_over(cache: LRUCache, old_version: int, new_version: int, changed: dict) -> int:
+    """Re-key to new_version the old_version results that the refresh leaves unchanged.
+
+    changed maps each (country, category) pair that got new observations to
+    the first new date. Returns the number of results carried over.
+    """
+    first_change = min(changed.values(), default=None)
+    kept = 0
+    for key, value in cache.items():
+        name, version, args, kwargs = key
+        scope = _scopes.get(name)
+        if version != old_version or kwargs or scope is None:
+            continue
+        pairs, last_date = scope(*args)
+        if pairs is None:
+            touched = first_change
+        else:
+            touched = min((changed[pair] for pair in pairs if pair in changed), default=None)
+        if touched is None or (last_date is not None and last_date < touched):
+            cache.put((name, new_version, args, kwargs), value)
+            kept += 1
+    return kept
@@ -3,14 +3,19 @@ import panel as pn
 import holoviews as hv
 
 import hvplot.polars
+from holoviews.operation.downsample import downsample1d
 
+from .alignment import PERIOD_NAMES
+from .catalog import series_catalog
 from .config import Settings
 from .card_manager import *
 from .data_processor import *
-from .widgets import *
+from .instrumentation import instrument, track
+from .session import session_state
 
-__all__ = ["first_tab_plotter","second_tab_plotter"]
+__all__ = ["first_tab_plotter","second_tab_plotter","heatmap_drag_plotter"]
 
+@instrument
 def first_tab_plotter(
         country,
         cpi,
@@ -19,17 +24,19 @@ def first_tab_plotter(
         mode,
         
     ):
-    if not benchmarks and not pn.state.cache["cards"]:       
+    state = session_state()
+    if not benchmarks and not state.cards:       
         return
     
-    correlation_df = pn.state.cache["full_correlations_data"]
+    correlation_df = state.cache["full_correlations_data"]
     # slot 0
     cpi_plot = plot_cpi(country, cpi, benchmarks, date_range, mode)
     add_card(content=cpi_plot, tab=0, slot=0, title=f"CPI Data {country}")
     # slot 1
     heat_plots = plot_correlation_heatmaps(correlation_df, country, cpi, mode)
-    add_card(heat_plots, tab=0, slot=1, need_update=True, need_clear=False, title=f"Correlations for {country} in mode {mode}")
+    add_card(heat_plots, tab=0, slot=1, need_clear=False, title=f"Correlations for {country} in mode {mode}")
 
+@instrument
 def second_tab_plotter(
         country,
         cpi,
@@ -37,115 +44,144 @@ def second_tab_plotter(
         date_range,
         mode,
     ):
-    if not benchmarks and not pn.state.cache["cards"]:        
+    state = session_state()
+    if not benchmarks and not state.cards:        
         return
-    correlation_df = pn.state.cache["full_correlations_data"]
+    correlation_df = state.cache["full_correlations_data"]
     ema_corr_plots = plot_correlation_matrix(correlation_df, country, cpi, benchmarks, date_range, mode)
-    add_card(content=ema_corr_plots, tab=1, slot=0, need_update=False, need_clear=False, title=f"EMA correlation matrix for {country}")
-    rolling_corr_plt = plot_rolling_correlation(country, cpi, mode, date_range, benchmarks, window = 12)
-    add_card(content=rolling_corr_plt, tab=1, slot=1, need_update=True, need_clear=False, title=f"Rolling correlations Data {country}")
+    add_card(content=ema_corr_plots, tab=1, slot=0, need_clear=False, title=f"EMA correlation matrix for {country}")
+    rolling_corr_plt = plot_rolling_correlation(country, cpi, mode, date_range, benchmarks, window=Settings.ROLLING_WINDOW)
+    add_card(content=rolling_corr_plt, tab=1, slot=1, need_clear=False, title=f"Rolling correlations Data {country}")
+    lag_plots = plot_lag_correlations(country, cpi, mode, date_range)
+    add_card(content=lag_plots, tab=1, slot=2, need_clear=False, title=f"Lead/lag correlations for {country}")
+
+@instrument
+def heatmap_drag_plotter(event):
+    """Refresh only the heatmaps while the date slider is dragged."""
+    state = session_state()
+    if not state.cards:
+        return
+    country, mode = state.widgets.country_selector.value, state.widgets.change_mode.value
+    correlation_df = state.cache["full_correlations_data"]
+    heat_plots = plot_correlation_heatmaps(correlation_df, country, state.widgets.cpi_selector.value, mode)
+    add_card(heat_plots, tab=0, slot=1, need_clear=False, title=f"Correlations for {country} in mode {mode}")
     
 
+_KPI_CARD = """
+<div style="background: {color}; border-radius: 6px; padding: 10px; text-align: center;">
+    <div style="font-size: 14px; font-weight: 600;">{label}</div>
+    <div style="font-size: 24px; font-weight: bold;">{display}</div>
+</div>
+"""
+
+def _kpi_frame(df: pl.DataFrame) -> pl.DataFrame:
+    """Latest value per series plus the Food-vs-Total gap per country.
+
+    Every series is read at the latest date all categories share. Rows come
+    back in card order: per country its series, then its gap row.
+    """
+    latest = (
+        df.lazy()
+        .filter(pl.col("date") == pl.col("date").max().over("category").min())
+        .group_by("country", "category")
+        .agg(pl.col("date").first(), pl.col("value").first())
+        .with_columns(pl.col("country", "category").cast(pl.String))
+    )
+    gaps = (
+        latest
+        .group_by("country")
+        .agg(
+            pl.col("date").first(),
+            (
+                pl.col("value").filter(pl.col("category") == "Food").first()
+                - pl.col("value").filter(pl.col("category") == "Total").first()
+            ).alias("value"),
+        )
+        .drop_nulls("value")
+        .with_columns(pl.lit("Food vs Total").alias("category"))
+    )
+    return (
+        pl.concat([
+            latest.with_columns(pl.lit(False).alias("is_gap")),
+            gaps.with_columns(pl.lit(True).alias("is_gap")).select("country", "category", "date", "value", "is_gap"),
+        ])
+        .sort("country", "is_gap", "category")
+        .collect()
+    )
+
 def _compute_kpis(df: pl.DataFrame, percent_mode: bool = False) -> pn.FlexBox:
+    """KPI strip for the current selection.
+
+    The strip and its cards live in the session and are reused across
+    updates, so only the values of existing cards change.
+    """
     if df.is_empty():
         return pn.FlexBox(pn.pane.Markdown("⚠️ No data"))
 
-    df = (
-        df
-        .with_columns(
-            pl.col("date").max().over("category").alias("max_date")
-        )        
-    )
-    common_latest_date = df.get_column("max_date").min()
-    latest_df = df.filter(pl.col("date") == common_latest_date)
+    state = session_state()
+    strip, pool = state.kpi_strip, state.kpi_cards
+
+    kpi_df = _kpi_frame(df)
     cards = []
-    available_categories = latest_df.select("category").unique().to_series()
-    for country in sorted(latest_df.select("country").unique().to_series()):
-        values = {}
-        for category in available_categories:
-            subset = latest_df.filter(
-                (pl.col("country") == country) & (pl.col("category") == category)
-            )
-            if not subset.is_empty():
-                val = subset.select("value")[0, 0]
-                values[category] = val
-                color = Settings.PLOT_COLORS.get((country, category), "#ddd")
-
-                # Format based on % toggle
-                if percent_mode:
-                    display = f"{val:+.2%}"  
-                else:
-                    display = f"{val:.1f}" 
-
-                cards.append(pn.pane.HTML(
-                    f"""
-                    <div style="background: {color}; border-radius: 6px; padding: 10px; text-align: center;">
-                        <div style="font-size: 14px; font-weight: 600;">{country} – {category}</div>
-                        <div style="font-size: 24px; font-weight: bold;">{display}</div>
-                    </div>
-                    """,
-                    width=Settings.CARD_WIDTH, height=80
-                ))
-
-        # Add gap card if Food and Total both exist
-        if "Food" in values and "Total" in values:
-            diff = values["Food"] - values["Total"]
-            gap_color = "#c8e6c9" if diff >= 0 else "#ffcdd2"
-            gap_display = f"{diff:+.2%}" if percent_mode else f"{diff:+.2f}"
-            cards.append(pn.pane.HTML(
-                f"""
-                <div style="background: {gap_color}; border-radius: 6px; padding: 10px; text-align: center;">
-                    <div style="font-size: 14px; font-weight: 600;">{country} – Food vs Total</div>
-                    <div style="font-size: 24px; font-weight: bold;">{gap_display}</div>
-                </div>
-                """,
-                width=Settings.CARD_WIDTH, height=80
-            ))
-
-    cards.append(pn.pane.Markdown(f"📅 Latest: **{common_latest_date}**", width=200))
-    return pn.FlexBox(*cards, sizing_mode="stretch_width", gap="10px")
+    for country, category, _, val, is_gap in kpi_df.iter_rows():
+        label = f"{country} – {category}"
+        if is_gap:
+            color = "#c8e6c9" if val >= 0 else "#ffcdd2"
+            display = f"{val:+.2%}" if percent_mode else f"{val:+.2f}"
+        else:
+            color = series_catalog().colors.get((country, category), "#ddd")
+            # Format based on % toggle
+            display = f"{val:+.2%}" if percent_mode else f"{val:.1f}"
+        card = pool.get(label)
+        if card is None:
+            card = pool[label] = pn.pane.HTML(width=Settings.CARD_WIDTH, height=80)
+        card.object = _KPI_CARD.format(color=color, label=label, display=display)
+        cards.append(card)
+
+    if "latest" not in pool:
+        pool["latest"] = pn.pane.Markdown(width=200)
+    pool["latest"].object = f"📅 Latest: **{kpi_df.get_column('date').min()}**"
+    cards.append(pool["latest"])
+
+    if len(strip.objects) != len(cards) or any(a is not b for a, b in zip(strip.objects, cards)):
+        strip.objects = cards
+    return strip
 
+def _level_of_detail(chart):
+    """Decimate curves to the plot's pixel width and visible x-range.
+
+    The operation is dynamic, so zooming or panning re-requests the detail
+    for the new range from the server instead of shipping every point.
+    """
+    if not Settings.DOWNSAMPLE_ALGORITHM:
+        return chart
+    return downsample1d(chart, algorithm=Settings.DOWNSAMPLE_ALGORITHM)
+
+def _columns(df: pl.DataFrame, *names: str) -> dict:
+    """Hand Polars columns to HoloViews as plain arrays.
+
+    Skips the pandas round trip: numeric columns without nulls are exposed
+    without copying and dates become ``datetime64[ms]``, which Bokeh
+    serializes as-is.
+    """
+    return track({
+        name: df.get_column(name).cast(pl.Datetime("ms")).to_numpy()
+        if df.schema[name] == pl.Date else df.get_column(name).to_numpy()
+        for name in names
+    })
+
+@instrument
 def plot_cpi(country, cpi, benchmarks, date_range, mode):
-    # Build valid country-category combinations
-    
-    selected_pairs = [(country, cat)  for cat in cpi] + [
-        (country, cat) for (country, cat) in Settings.PLOT_COLORS if cat in benchmarks
-    ]
-    df = pn.state.cache["full_raw_data"]
-    # Now filter using tuple column logic
-    raw_filtered = (
-        df.with_columns(
-            (pl.col("country") + "||" + pl.col("category")).alias("pair_key")
-        )
-        .filter(
-            pl.col("pair_key").is_in([
-                f"{c}||{cat}" for (c, cat) in selected_pairs
-            ]) &
-            (pl.col("date") >= date_range[0]) &
-            (pl.col("date") <= date_range[1])
-        )
-        .drop("pair_key")
-        .sort("date")
-    )
-    if raw_filtered.is_empty():
+    display_df = transform_selection(country, cpi, benchmarks, date_range, mode)
+    if display_df.is_empty():
         return pn.pane.Markdown("### ⚠️ No data for current filter.")
 
-    # Apply window-based % change if needed
     if mode == "MoM %":
-        display_df = raw_filtered.with_columns(
-            pl.col("value").pct_change().over(["country", "category"]).alias("value")
-        )
         ylabel = "% change (MoM)"
     elif mode == "YoY %":
-        display_df = raw_filtered.with_columns(
-            (
-                pl.col("value") / pl.col("value").shift(12) - 1
-            ).over(["country", "category"]).alias("value")
-        )
         ylabel = "% change (YoY)"
     else:
-        display_df = raw_filtered
-        ylabel = "Index (2015 = 100)"
+        ylabel = f"Index ({Settings.BASE_YEAR} = 100)"
 
     display_df = (
         display_df
@@ -153,16 +189,14 @@ def plot_cpi(country, cpi, benchmarks, date_range, mode):
             (pl.col("country") + " – " + pl.col("category")).alias("group_key")
         )        
     )
-    color_map = {
-        f"{country} – {category}": color
-        for (country, category), color in Settings.PLOT_COLORS.items()
-    }
+    color_map = series_catalog().label_colors
    
     curves = []
-    for key, group in display_df.to_pandas().groupby("group_key"):
+    series = display_df.partition_by("group_key", as_dict=True, include_key=False)
+    for (key,), group in sorted(series.items()):
         
         curve = hv.Curve(
-            group,
+            _columns(group, "date", "value"),
             kdims=["date"],
             vdims=["value"],
             label=key
@@ -188,15 +222,14 @@ def plot_cpi(country, cpi, benchmarks, date_range, mode):
         responsive=True,
         show_grid=True
     )       
+    chart = _level_of_detail(chart)
     kpis = _compute_kpis(display_df, percent_mode=(mode != "Index"))
    
     return pn.Column(kpis, chart)
 
+@instrument
 def plot_correlation_heatmaps(correlation_df, country, cpi, mode):   
-    try:
-        min_max_corr_df, filtered_corr_df = pn.state.cache[country, ','.join(cpi_selector.value), mode, date_slider.value]
-    except KeyError:
-        min_max_corr_df, filtered_corr_df = calc_min_max_correlations(correlation_df, country, cpi, mode)
+    min_max_corr_df, filtered_corr_df = calc_min_max_correlations(correlation_df, country, cpi, mode)
     plots = []
     for corr_type in ["Pearson", "Spearman"]:
         plot_df = (
@@ -223,47 +256,49 @@ def plot_correlation_heatmaps(correlation_df, country, cpi, mode):
             min_max_corr_df
             .rename({"CPI":"CPI_strongest", "CPI_right":"CPI_weakest"})
         )
+    # Panel's table panes still need pandas; Arrow-backed columns avoid the copy
     return pn.Column(
-        pn.pane.DataFrame(final_kpi_df.to_pandas(), height=140),
+        pn.pane.DataFrame(final_kpi_df.to_pandas(use_pyarrow_extension_array=True), height=140),
         pn.Row(*plots)
     )  
 
 
-def plot_rolling_correlation(country: str, cpi: str, mode: str, date_range: tuple, benchmarks: list, window: int = 12):
-    df = pn.state.cache["full_raw_data"]
-    
+@instrument
+def plot_rolling_correlation(country: str, cpi: str, mode: str, date_range: tuple, benchmarks: list, window: int = Settings.ROLLING_WINDOW):
     if not benchmarks:
         return pn.pane.Markdown("### ⚠️ No data for current filter.")
-    benchmark_colors = {
-        bench: color for (country, bench), color in Settings.PLOT_COLORS.items()
-    }
-    df = df.filter((pl.col("date") >= date_range[0]) & (pl.col("date") <= date_range[1]))
-    r_df = compute_rolling_correlation(df, cpi, country, mode, benchmarks, window)
+    benchmark_colors = series_catalog().category_colors
+    r_df = rolling_correlation(country, cpi, mode, date_range, benchmarks, window)
 
     if r_df.is_empty():
         return pn.pane.Markdown("### ⚠️ Not enough data for rolling correlation")
+    # One line per CPI category and benchmark; benchmark colors only tell lines apart for a single category
+    single = len(cpi) == 1
     r_df = (
         r_df
         .with_columns(
-            pl.col('benchmark').replace(benchmark_colors).alias('col')
+            pl.col('benchmark').replace(benchmark_colors).alias('col'),
+            (pl.col('benchmark') if single else pl.col('CPI') + " – " + pl.col('benchmark')).alias('series'),
         )
     )
     return r_df.hvplot.line(
-        x="date", y="rolling_corr", by="benchmark",
-        color="col",
+        x="date", y="rolling_corr", by="series",
+        color="col" if single else None,
         title=f"Rolling Pearson Correlation ({cpi}({mode}) of {country} with {benchmarks})",
         xlabel="Date", ylabel="Correlation",
-        grid=True, responsive=True, height=Settings.HEIGHT
+        grid=True, responsive=True, height=Settings.HEIGHT,
+        downsample=Settings.DOWNSAMPLE_ALGORITHM or False
     )
 
 
+@instrument
 def plot_correlation_matrix(correlation_df, country: str, cpi: list, benchmarks: list, date_range: tuple, mode: str):
     correlation_order = [
         "Pearson", "Spearman",
         "Pearson (EMA3)", "Spearman (EMA3)",
         "Pearson (EMA6)", "Spearman (EMA6)"
     ]
-    benchmarks =  pn.state.cache["categories"]
+    benchmarks =  session_state().data["categories"]
 
     df_long = (
         correlation_df
@@ -283,10 +318,12 @@ def plot_correlation_matrix(correlation_df, country: str, cpi: list, benchmarks:
             pl.when(pl.col("correlation_type").is_in(correlation_order))
             .then(pl.col("correlation_type").cast(pl.Enum(correlation_order)))
             .alias("correlation_type"),
-            pl.col("correlation_type").map_elements(
-                lambda x: Settings.PEARSON_COL if str(x).startswith("Pearson") else Settings.SPEARMAN_COL,
-                return_dtype=pl.String
-            ).alias("color")
+            # No Python UDF: it would need the GIL inside polars' thread pool, which
+            # deadlocks against polars work running on other threads
+            pl.when(pl.col("correlation_type").str.starts_with("Pearson"))
+            .then(pl.lit(Settings.PEARSON_COL))
+            .otherwise(pl.lit(Settings.SPEARMAN_COL))
+            .alias("color")
         ])
         .sort(["correlation_type","benchmark","correlation"],descending=True)
     )
@@ -306,3 +343,62 @@ def plot_correlation_matrix(correlation_df, country: str, cpi: list, benchmarks:
         color="color"
     )
     return plot
+
+
+def _lead_text(benchmark: str, lag: int) -> str:
+    """Plain reading of a peak lag; positive lags are the benchmark leading the CPI."""
+    unit = PERIOD_NAMES[Settings.ANALYSIS_FREQUENCY]
+    if lag > 0:
+        return f"{benchmark} leads by {lag} {unit}"
+    if lag < 0:
+        return f"{benchmark} lags by {-lag} {unit}"
+    return f"{benchmark} moves with it"
+
+
+@instrument
+def plot_lag_correlations(country: str, cpi: list, mode: str, date_range: tuple):
+    lag_df = selection_lag_correlations(country, cpi, date_range, mode)
+    peaks = peak_lags(lag_df)
+    if peaks.is_empty():
+        return pn.pane.Markdown("### ⚠️ Not enough overlapping data for the lag scan")
+    unit = PERIOD_NAMES[Settings.ANALYSIS_FREQUENCY]
+
+    kpis = []
+    strongest = peaks.group_by("correlation_type", maintain_order=True).first()
+    for corr_type, cpi_cat, benchmark, lag, value in strongest.select(
+        "correlation_type", "CPI", "benchmark", "peak_lag", "peak_correlation"
+    ).iter_rows():
+        kpis.append(pn.pane.HTML(
+            _KPI_CARD.format(
+                color="#c8e6c9" if value >= 0 else "#ffcdd2",
+                label=f"Peak {corr_type}: {country} – {cpi_cat}",
+                display=f"{value:+.2f}<div style='font-size: 13px;'>{_lead_text(benchmark, lag)}</div>",
+            ),
+            width=Settings.CARD_WIDTH + 60, height=100,
+        ))
+
+    plot_df = (
+        lag_df.with_columns((pl.col("CPI") + " – " + pl.col("benchmark")).alias("pair"))
+    )
+    plots = [
+        plot_df.hvplot.heatmap(
+            x="lag",
+            y="pair",
+            C=corr_type,
+            cmap="seismic",
+            clim=(-1, 1),
+            colorbar=True,
+            title=f"{corr_type} by lag ({mode}), positive: benchmark leads",
+            xlabel=f"lag ({unit})",
+            ylabel="",
+            height=Settings.HEIGHT,
+            responsive=True,
+        )
+        for corr_type in ["Pearson", "Spearman"]
+    ]
+    # Panel's table panes still need pandas; Arrow-backed columns avoid the copy
+    return pn.Column(
+        pn.FlexBox(*kpis, gap="10px"),
+        pn.pane.DataFrame(peaks.to_pandas(use_pyarrow_extension_array=True), height=200),
+        pn.Row(*plots),
+    )
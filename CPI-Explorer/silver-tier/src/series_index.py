@@ -0,0 +1,72 @@
+import logging
+import polars as pl
+
+from .catalog import series_catalog
+from .config import Settings
+
+logger = logging.getLogger("app_logger")
+
+__all__ = ["compact_frame", "build_series_index", "select_series"]
+
+_VALUE_DTYPES = {"Float32": pl.Float32, "Float64": pl.Float64}
+
+
+def _enum(known: list, present: pl.Series) -> pl.Enum:
+    """Enum of the catalog values in catalog order, plus any unexpected ones found."""
+    values = list(dict.fromkeys(known))
+    extra = sorted(set(present.unique().to_list()) - set(values))
+    if extra:
+        logger.warning(f"{present.name} values missing from the catalog: {extra}")
+    return pl.Enum(values + extra)
+
+
+def compact_frame(df: pl.DataFrame) -> pl.DataFrame:
+    """Cast merged series to the canonical schema and lay them out one after another.
+
+    country and category become Enums built from the catalog, value takes
+    Settings.VALUE_DTYPE, and rows are sorted by (country, category, date)
+    so every series is a contiguous, date-sorted block.
+    """
+    catalog = series_catalog()
+    countries = _enum(catalog.all_countries, df.get_column("country"))
+    categories = _enum(catalog.all_categories, df.get_column("category"))
+    return (
+        df.select(
+            pl.col("date").cast(pl.Date),
+            pl.col("country").cast(countries),
+            pl.col("category").cast(categories),
+            pl.col("value").cast(_VALUE_DTYPES[Settings.VALUE_DTYPE]),
+        )
+        .sort("country", "category", "date")
+    )
+
+
+def build_series_index(df: pl.DataFrame) -> dict:
+    """(country, category) -> (first row, row count) of each block in a compact frame."""
+    blocks = (
+        df.with_row_index("row")
+        .group_by("country", "category", maintain_order=True)
+        .agg(pl.col("row").first().alias("start"), pl.len().alias("length"))
+    )
+    return {(country, category): (start, length) for country, category, start, length in blocks.iter_rows()}
+
+
+def select_series(df: pl.DataFrame, index: dict, pairs: list, date_range: tuple = None) -> pl.DataFrame:
+    """Rows of the given (country, category) pairs, cut to date_range, without scanning.
+
+    Each series is sliced out by its offsets and its date range found by
+    binary search; slices share the compact frame's buffers.
+    """
+    blocks = []
+    for pair in dict.fromkeys(pairs):
+        if pair not in index:
+            continue
+        start, length = index[pair]
+        block = df.slice(start, length)
+        if date_range is not None:
+            dates = block.get_column("date")
+            first = dates.search_sorted(date_range[0], side="left")
+            last = dates.search_sorted(date_range[1], side="right")
+            block = block.slice(first, last - first)
+        blocks.append(block)
+    return pl.concat(blocks) if blocks else df.clear()
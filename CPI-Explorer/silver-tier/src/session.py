@@ -0,0 +1,122 @@
+import threading
+from types import MappingProxyType
+import panel as pn
+
+__all__ = ["session_state", "shared_data"]
+
+class SharedData:
+    """Read-only datasets published by the loader and shared by all sessions.
+
+    Every publish creates a new immutable snapshot. Sessions pin the snapshot
+    they started with, so a reload never swaps data under a live session, and
+    the registry forgets a snapshot once its last session has released it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._current = None
+        self._refs = {}
+        self._version = 0
+        self._retire_hooks = []
+
+    @property
+    def current(self) -> MappingProxyType:
+        return self._current
+
+    def publish(self, **datasets):
+        with self._lock:
+            self._version += 1
+            self._current = MappingProxyType(dict(datasets, version=self._version))
+        self._retired()
+
+    def acquire(self) -> MappingProxyType:
+        with self._lock:
+            snapshot = self._current
+            if snapshot is not None:
+                self._refs.setdefault(id(snapshot), [snapshot, 0])[1] += 1
+            return snapshot
+
+    def release(self, snapshot: MappingProxyType):
+        with self._lock:
+            entry = self._refs.get(id(snapshot))
+            if entry is None:
+                return
+            entry[1] -= 1
+            if entry[1] > 0:
+                return
+            del self._refs[id(snapshot)]
+        self._retired()
+
+    def versions_in_use(self) -> set:
+        """Versions of the current snapshot and of every snapshot a session holds."""
+        with self._lock:
+            versions = {entry[0]["version"] for entry in self._refs.values()}
+            if self._current is not None:
+                versions.add(self._current["version"])
+            return versions
+
+    def on_retire(self, callback):
+        """Call callback() whenever a snapshot may have lost its last user: after a publish or a last release."""
+        self._retire_hooks.append(callback)
+
+    def _retired(self):
+        for callback in self._retire_hooks:
+            callback()
+
+    def refcount(self, snapshot: MappingProxyType = None) -> int:
+        entry = self._refs.get(id(snapshot if snapshot is not None else self._current))
+        return entry[1] if entry else 0
+
+
+shared_data = SharedData()
+
+
+class SessionState:
+    """Everything one browser session owns: widgets, cards and computed results."""
+
+    def __init__(self):
+        self.data = shared_data.acquire()
+        self.widgets = None
+        self.cards = {}
+        self.tabs = pn.Tabs()
+        self.tab_columns = {}
+        self.kpi_strip = pn.FlexBox(sizing_mode="stretch_width", gap="10px")
+        self.kpi_cards = {}
+        self.cache = {}
+        # channel -> generation token and in-flight task of latest-wins callbacks
+        self.generations = {}
+        self.tasks = {}
+        # Handed out in export links, see src/export.py
+        self.export_token = None
+
+    def rebase(self) -> MappingProxyType:
+        """Move to the current snapshot, releasing the one held; returns that one."""
+        previous, self.data = self.data, shared_data.acquire()
+        if previous is not None:
+            shared_data.release(previous)
+        return previous
+
+    def attach(self) -> MappingProxyType:
+        """Acquire the shared snapshot if it was not published yet when the session started."""
+        if self.data is None:
+            self.data = shared_data.acquire()
+        return self.data
+
+
+_sessions = {}
+
+def _end_session(key):
+    state = _sessions.pop(key, None)
+    if state is not None:
+        shared_data.release(state.data)
+
+def session_state() -> SessionState:
+    """State of the session being served; a single local one outside a server."""
+    doc = pn.state.curdoc
+    key = id(doc) if doc is not None else None
+    state = _sessions.get(key)
+    if state is None:
+        state = _sessions[key] = SessionState()
+        if doc is not None:
+            doc.on_session_destroyed(lambda session_context: _end_session(key))
+    return state
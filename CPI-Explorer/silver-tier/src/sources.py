@@ -0,0 +1,97 @@
+import logging
+from pathlib import Path
+
+import polars as pl
+
+from .catalog import series_catalog
+from .downloader import fetch_fred_series
+
+logger = logging.getLogger("app_logger")
+
+__all__ = ["register_adapter"]
+
+# adapter name -> how a series is read out of that source's files
+ADAPTERS = {}
+
+
+def register_adapter(name: str, *, date, value, date_format: str, fetch=None, **csv_options):
+    """Declare a source format.
+
+    date and value are column names, or positions for formats that name
+    columns after the series. csv_options go to pl.scan_csv as they are;
+    fetch, if given, maps a list of series ids to {id: (path, status)}
+    the way fetch_fred_series does.
+    """
+    ADAPTERS[name] = {
+        "date": date,
+        "value": value,
+        "date_format": date_format,
+        "fetch": fetch,
+        "csv_options": csv_options,
+    }
+
+
+register_adapter("fred", date=0, value=1, date_format="%Y-%m-%d", fetch=fetch_fred_series)
+register_adapter("ecb_sdmx", date="TIME_PERIOD", value="OBS_VALUE", date_format="%Y-%m")
+# Two title lines above the header, and bare CR line endings
+register_adapter("fao", date="Date", value="Food Price Index", date_format="%Y-%m", skip_rows=2, eol_char="\r")
+register_adapter("generic", date="date", value="value", date_format="%Y-%m-%d")
+
+
+def adapter_spec(source: dict) -> dict:
+    """The source's adapter, with any options the source overrides."""
+    spec = ADAPTERS[source["adapter"]]
+    return {
+        **spec,
+        **{key: source[key] for key in ("date", "value", "date_format") if key in source},
+        "csv_options": {**spec["csv_options"], **source.get("csv_options", {})},
+    }
+
+
+def source_key(source: dict) -> str:
+    """Slot of the source in pn.state.cache: <country>_<category> for CPI series, else the category."""
+    if series_catalog().is_cpi(source["country"], source["category"]):
+        return f"{source['country']}_{source['category']}"
+    return source["category"]
+
+
+def source_params(source: dict) -> dict:
+    """Everything that shapes the normalized frame of a source, for the series store manifest."""
+    spec = adapter_spec(source)
+    return {
+        **{key: value for key, value in source.items() if key != "file"},
+        **{key: value for key, value in spec.items() if key != "fetch"},
+    }
+
+
+def scan_source(source: dict, path: Path) -> pl.LazyFrame:
+    """Lazy scan of one series in the canonical date, country, category, value layout.
+
+    Only the date and value columns are read. Rows whose date or value does
+    not parse are dropped, and with a base_year the values are rebased to a
+    median of 100 over that year, all in the same query.
+    """
+    spec = adapter_spec(source)
+    lf = pl.scan_csv(path, infer_schema=False, **spec["csv_options"])
+    if isinstance(spec["date"], int) or isinstance(spec["value"], int):
+        # Reads the header line only
+        names = lf.collect_schema().names()
+    date_col, value_col = (
+        names[column] if isinstance(column, int) else column for column in (spec["date"], spec["value"])
+    )
+    lf = (
+        lf.select(
+            pl.col(date_col).str.strptime(pl.Date, spec["date_format"], strict=False).alias("date"),
+            pl.col(value_col).cast(pl.Float64, strict=False).alias("value"),
+        )
+        .filter(pl.col("date").is_not_null() & pl.col("value").is_not_null())
+    )
+    if source.get("base_year"):
+        base = pl.col("value").filter(pl.col("date").dt.year() == source["base_year"]).median()
+        lf = lf.with_columns((pl.col("value") * (100 / base)).round(1))
+    return lf.select(
+        "date",
+        pl.lit(source["country"]).alias("country"),
+        pl.lit(source["category"]).alias("category"),
+        "value",
+    )
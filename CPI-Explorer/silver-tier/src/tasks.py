@@ -0,0 +1,48 @@
+import asyncio
+import logging
+
+from .session import session_state
+
+logger = logging.getLogger("app_logger")
+
+__all__ = ["run_latest", "supersede"]
+
+
+def supersede(*channels):
+    """Invalidate the in-flight work of the session's channels and cancel their tasks."""
+    state = session_state()
+    for channel in channels:
+        state.generations[channel] = state.generations.get(channel, 0) + 1
+        task = state.tasks.pop(channel, None)
+        if task is not None and task is not asyncio.current_task() and not task.done():
+            task.cancel()
+
+
+async def run_latest(channel: str, apply, prefetch=None) -> bool:
+    """Run a widget callback so that only the newest call on ``channel`` takes effect.
+
+    Each call takes a new generation token for the channel and cancels the
+    task of the call it supersedes. ``prefetch`` runs off the event loop,
+    typically warming the memo cache with the data ``apply`` needs; ``apply``
+    then runs back on the loop and is skipped if a newer call arrived in the
+    meantime. Returns whether ``apply`` ran.
+    """
+    state = session_state()
+    supersede(channel)
+    generation = state.generations[channel]
+    state.tasks[channel] = asyncio.current_task()
+    try:
+        # Let events already queued behind this one supersede it before any work starts
+        await asyncio.sleep(0)
+        if prefetch is not None and state.generations[channel] == generation:
+            await asyncio.to_thread(prefetch)
+    except asyncio.CancelledError:
+        logger.debug(f"{channel} generation {generation} cancelled")
+        return False
+    if state.generations[channel] != generation:
+        logger.debug(f"{channel} generation {generation} superseded, result discarded")
+        return False
+    if state.tasks.get(channel) is asyncio.current_task():
+        del state.tasks[channel]
+    apply()
+    return True
@@ -1,21 +1,37 @@
-from io import BytesIO
 import datetime as dt
+import html
+import param
 import polars as pl
 import panel as pn
+from .config import Settings
 from .data_processor import *
-from .widgets import *
+from .corr_engine import *
+from .correlation_cube import cube_correlations, standard_windows
+from .export import export_url
+from .instrumentation import instrument
+from .plotter import *
+from .session import session_state, shared_data
+from .tasks import run_latest, supersede
 
 __all__ = [
     "error_msg_handler","correlations_calculations","on_load_trigger","min_max_corr_handler",
-    "type_corr_handler","download_callback"
+    "type_corr_handler","download_callback","store_correlations","slider_drag_handler","refresh_tabs",
+    "date_preset_handler","follow_data_updates"
     ]
 
+@instrument
 def on_load_trigger():     
+    state = session_state()
+    date_slider = state.widgets.date_slider
     start, end = date_slider.value       
     new_end = end + dt.timedelta(days=1)
     new_end = end - dt.timedelta(days=1)
     date_slider.value = (start, new_end)
-    benchmark_selector.value = [pn.state.cache["max_corr_bench_spearman"]]
+    with param.edit_constant(date_slider):
+        date_slider.value_throttled = (start, new_end)
+    # The slider callbacks run as tasks, so the initial pick is computed here
+    store_correlations(calc_correlations((start, new_end)))
+    state.widgets.benchmark_selector.value = [state.cache["max_corr_bench_spearman"]]
 
 def error_msg_handler(*args):
     if (errors := pn.state.cache.get("error_msg", [])):
@@ -23,55 +39,152 @@ def error_msg_handler(*args):
             pn.state.notifications.error(msg)
         pn.state.cache["error_msg"] = []
 
-def download_callback():
+_EXPORT_LINK = """
+<a href="{url}" download style="display: block; padding: 8px; border-radius: 4px; text-align: center;
+   background: #4caf50; color: white; font-weight: 600; text-decoration: none;">Download as {fmt}</a>
+"""
 
-    file_ = download_selector.value    
-    df_cached = pn.state.cache.get(file_)
-    if df_cached is None or df_cached.is_empty():
-        file_download.filename = "empty.csv"
-        return BytesIO(b"No data")
-    now = dt.datetime.now().replace(second=0, microsecond=0).strftime("%Y-%m-%d_%H-%M")
-    csv_bytes = df_cached.write_csv().encode("utf-8")
-    file_download.filename = file_download.filename = f'{file_}_{now}.csv'
-    return BytesIO(csv_bytes) 
+@instrument
+def download_callback(*events):
+    """Point the export link at the selected file, format and compression.
 
-def correlations_calculations(event):
+    The file itself is streamed by the export route in chunks, off the
+    event loop, when the link is followed.
+    """
+    state = session_state()
+    w = state.widgets
+    url = export_url(state, w.download_selector.value, w.export_format.value, w.export_compression.value)
+    w.export_link.object = _EXPORT_LINK.format(url=html.escape(url), fmt=w.export_format.value)
 
-    correlation_df = calc_correlations(event.new)
-    pn.state.cache["full_correlations_data"]=correlation_df
+def store_correlations(correlation_df):
+    """Cache the correlations and the strongest/weakest benchmarks for the current selection."""
+    state = session_state()
+    w = state.widgets
+    state.cache["full_correlations_data"]=correlation_df
     min_max_corr_df, filtered_corr_df = calc_min_max_correlations(
-        correlation_df, country_selector.value, cpi_selector.value, change_mode.value)
-    pn.state.cache["filtered_correlations_data"]=filtered_corr_df
-    pn.state.cache["strongest_weakest_correlations"]=min_max_corr_df
-    pn.state.cache[country_selector.value, ",".join(cpi_selector.value), change_mode.value, event.new] = min_max_corr_df, filtered_corr_df
-    pn.state.cache["max_corr_bench_pearson"]=min_max_corr_df.filter(pl.col("correlation_type")=="Pearson").get_column("strongest_benchmark")[0]
-    pn.state.cache["max_corr_bench_spearman"]=min_max_corr_df.filter(pl.col("correlation_type")=="Spearman").get_column("strongest_benchmark")[0]
-    pn.state.cache["min_corr_bench_pearson"]=min_max_corr_df.filter(pl.col("correlation_type")=="Pearson").get_column("weakest_benchmark")[0]
-    pn.state.cache["min_corr_bench_spearman"]=min_max_corr_df.filter(pl.col("correlation_type")=="Spearman").get_column("weakest_benchmark")[0]
+        correlation_df, w.country_selector.value, w.cpi_selector.value, w.change_mode.value)
+    state.cache["filtered_correlations_data"]=filtered_corr_df
+    state.cache["strongest_weakest_correlations"]=min_max_corr_df
+    state.cache["max_corr_bench_pearson"]=min_max_corr_df.filter(pl.col("correlation_type")=="Pearson").get_column("strongest_benchmark")[0]
+    state.cache["max_corr_bench_spearman"]=min_max_corr_df.filter(pl.col("correlation_type")=="Spearman").get_column("strongest_benchmark")[0]
+    state.cache["min_corr_bench_pearson"]=min_max_corr_df.filter(pl.col("correlation_type")=="Pearson").get_column("weakest_benchmark")[0]
+    state.cache["min_corr_bench_spearman"]=min_max_corr_df.filter(pl.col("correlation_type")=="Spearman").get_column("weakest_benchmark")[0]
+
+@instrument
+def correlations_calculations(event):
+    state = session_state()
+    # While dragging serve from the cube or the prefix-sum index, recompute exactly on release
+    if event.name == "value_throttled":
+        correlation_df = calc_correlations(event.new)
+    else:
+        correlation_df = cube_correlations(state.data, event.new)
+        if correlation_df is None:
+            correlation_df = windowed_correlations(event.new, [state.widgets.country_selector.value])
+    store_correlations(correlation_df)
+
+@instrument
+def date_preset_handler(event):
+    """Move the date slider to a standard window, which the correlation cube answers."""
+    state = session_state()
+    date_slider = state.widgets.date_slider
+    window = standard_windows(state.data["min_date"], state.data["max_date"])[event.new]
+    date_slider.value = window
+    with param.edit_constant(date_slider):
+        date_slider.value_throttled = window
+
+async def slider_drag_handler(event):
+    """Update the windowed correlations and heatmaps for the newest slider position only."""
+    def apply():
+        correlations_calculations(event)
+        heatmap_drag_plotter(event)
+    await run_latest("drag", apply)
 
+async def refresh_tabs(country, cpi, benchmarks, date_range, mode):
+    """Recompute the exact correlations and redraw both tabs for a settled widget state.
+
+    The data work runs off the event loop and fills the memo cache; the
+    plotters then draw from it, unless a newer widget state came in first.
+    """
+    # A released slider or a new selection makes pending drag updates moot
+    supersede("drag")
+
+    # Instrumented under their own names: the thread's memo lookups and latency are reported
+    # for the settled-state work rather than as "other"
+    @instrument
+    def prefetch_tabs():
+        correlation_df = calc_correlations(date_range)
+        calc_min_max_correlations(correlation_df, country, cpi, mode)
+        transform_selection(country, cpi, benchmarks, date_range, mode)
+        if benchmarks:
+            rolling_correlation(country, cpi, mode, date_range, benchmarks, Settings.ROLLING_WINDOW)
+        peak_lags(selection_lag_correlations(country, cpi, date_range, mode))
+
+    @instrument
+    def redraw_tabs():
+        store_correlations(calc_correlations(date_range))
+        first_tab_plotter(country, cpi, benchmarks, date_range, mode)
+        second_tab_plotter(country, cpi, benchmarks, date_range, mode)
+    await run_latest("tabs", redraw_tabs, prefetch_tabs)
+
+async def follow_data_updates():
+    """Move the session onto a refreshed data snapshot and redraw it.
+
+    A date range that ended at the latest data keeps following it. Results
+    the refresh did not touch were carried over, so only views of changed
+    series are recomputed.
+    """
+    state = session_state()
+    current = shared_data.current
+    if state.widgets is None or state.data is None or current is None or current["version"] == state.data["version"]:
+        return
+    previous = state.rebase()
+    w = state.widgets
+    w.benchmark_selector.options = list(current["categories"])
+    start, end = w.date_slider.value
+    lag = previous["max_date"] - end
+    if lag <= dt.timedelta(days=1):
+        end = current["max_date"] - lag
+    window = (max(start, current["min_date"]), min(end, current["max_date"]))
+    w.date_slider.param.update(start=current["min_date"], end=current["max_date"], value=window)
+    if pn.state.notifications is not None:
+        pn.state.notifications.info(f"Data updated, latest observation {current['max_date']}", duration=5000)
+    if w.date_slider.value_throttled != window:
+        # Redraws through the tab binding
+        with param.edit_constant(w.date_slider):
+            w.date_slider.value_throttled = window
+    else:
+        await refresh_tabs(
+            w.country_selector.value, w.cpi_selector.value, w.benchmark_selector.value, window, w.change_mode.value
+        )
 
+@instrument
 def min_max_corr_handler(event):
+    state = session_state()
+    corr_type_selector = state.widgets.corr_type_selector
     if event.new == "Strongest" and corr_type_selector.value == "Pearson":
-        sel_bench = [pn.state.cache["max_corr_bench_pearson"]]
+        sel_bench = [state.cache["max_corr_bench_pearson"]]
     elif event.new == "Strongest" and corr_type_selector.value == "Spearman":
-        sel_bench = [pn.state.cache["max_corr_bench_spearman"]]
+        sel_bench = [state.cache["max_corr_bench_spearman"]]
     elif event.new == "Weakest" and corr_type_selector.value == "Pearson":
-        sel_bench = [pn.state.cache["min_corr_bench_pearson"]]
+        sel_bench = [state.cache["min_corr_bench_pearson"]]
     elif event.new == "Weakest" and corr_type_selector.value == "Spearman":
-        sel_bench = [pn.state.cache["min_corr_bench_spearman"]]
+        sel_bench = [state.cache["min_corr_bench_spearman"]]
     else:
         sel_bench = []
-    benchmark_selector.value = sel_bench
+    state.widgets.benchmark_selector.value = sel_bench
 
+@instrument
 def type_corr_handler(event):
+    state = session_state()
+    corr_strength = state.widgets.corr_strength
     if event.new == "Pearson" and corr_strength.value == "Strongest":
-        sel_bench = [pn.state.cache["max_corr_bench_pearson"]]
+        sel_bench = [state.cache["max_corr_bench_pearson"]]
     elif event.new == "Spearman" and corr_strength.value == "Strongest":
-        sel_bench = [pn.state.cache["max_corr_bench_spearman"]]
+        sel_bench = [state.cache["max_corr_bench_spearman"]]
     elif event.new == "Pearson" and corr_strength.value == "Weakest":
-        sel_bench = [pn.state.cache["min_corr_bench_pearson"]]
+        sel_bench = [state.cache["min_corr_bench_pearson"]]
     elif event.new == "Spearman" and corr_strength.value == "Weakest":
-        sel_bench = [pn.state.cache["min_corr_bench_spearman"]]
+        sel_bench = [state.cache["min_corr_bench_spearman"]]
     else:
         sel_bench = []
-    benchmark_selector.value = sel_bench
\ No newline at end of file
+    state.widgets.benchmark_selector.value = sel_bench
@@ -1,82 +1,118 @@
-from io import BytesIO
+from types import SimpleNamespace
 import panel as pn
+from .catalog import series_catalog
 from .config import Settings
 
 
 
-__all__ = ["country_selector","cpi_selector","benchmark_selector","corr_type_selector","file_download",
-           "date_slider","change_mode","download_click_bth","corr_strength","download_selector"]
-
-country_selector = pn.widgets.Select(
-    name="Country",
-    options=Settings.COUNTRIES,
-    value=Settings.COUNTRIES[0]
-)
-
-cpi_selector = pn.widgets.CheckButtonGroup(
-    name="CPI Types",
-    options=Settings.CPI_CATEGORIES,
-    value=[Settings.CPI_CATEGORIES[0]],
-    button_style="outline",
-    button_type="primary",
-)
-
-
-benchmark_selector = pn.widgets.MultiChoice(
-    name="Benchmarks",
-    options=pn.state.cache["categories"],
-    value=[],
-    placeholder="May select one or more benchmarks..."
-)
-
-date_slider = pn.widgets.DateRangeSlider(
-    name="Date Range", 
-    start = pn.state.cache["min_date"], 
-    end= pn.state.cache["max_date"], 
-    value=(pn.state.cache["min_date"], pn.state.cache["max_date"])
-)
-
-change_mode = pn.widgets.RadioButtonGroup(
-    name="Change Mode",
-    options=Settings.MODES,
-    button_type="primary",
-    value="Index",
-    button_style="outline",
-    
-)
-
-
-corr_type_selector = pn.widgets.RadioButtonGroup(
-    name="Corelation Types",
-    options=["Pearson","Spearman"],
-    button_type="primary",
-    value="Spearman",
-    button_style="outline",
-)
-
-corr_strength = pn.widgets.RadioButtonGroup(
-    name="Strength Mode",
-    options=["Weakest","Strongest"],
-    button_type="primary",
-    value="Strongest",
-    button_style="outline",    
-)
-
-download_selector = pn.widgets.Select(
-    name="Files",
-    options=Settings.DOWNLOADS_FILES,    
-)
-
-download_click_bth = pn.widgets.Button(
-    name="Download",    
-    button_type="success"
-)
-
-file_download = pn.widgets.FileDownload(
-    auto=True,
-    label="Download as CSV", 
-    filename="placeholder.csv",
-    callback=lambda: BytesIO(b""),
-    button_type="success",
-    visible=True
-)
\ No newline at end of file
+__all__ = ["create_widgets"]
+
+def create_widgets(data) -> SimpleNamespace:
+    """Build one session's set of widgets from the shared dataset snapshot."""
+    catalog = series_catalog()
+    country_selector = pn.widgets.Select(
+        name="Country",
+        options=catalog.countries,
+        value=catalog.countries[0]
+    )
+
+    cpi_selector = pn.widgets.CheckButtonGroup(
+        name="CPI Types",
+        options=catalog.cpi_categories,
+        value=[catalog.cpi_categories[0]],
+        button_style="outline",
+        button_type="primary",
+    )
+
+
+    benchmark_selector = pn.widgets.MultiChoice(
+        name="Benchmarks",
+        options=data["categories"],
+        value=[],
+        placeholder="May select one or more benchmarks..."
+    )
+
+    date_slider = pn.widgets.DateRangeSlider(
+        name="Date Range", 
+        start = data["min_date"], 
+        end= data["max_date"], 
+        value=(data["min_date"], data["max_date"])
+    )
+
+    date_presets = pn.widgets.MenuButton(
+        name="Date presets",
+        items=list(Settings.CUBE_WINDOWS),
+        button_type="primary",
+        button_style="outline",
+    )
+
+    change_mode = pn.widgets.RadioButtonGroup(
+        name="Change Mode",
+        options=Settings.MODES,
+        button_type="primary",
+        value="Index",
+        button_style="outline",
+        
+    )
+
+
+    corr_type_selector = pn.widgets.RadioButtonGroup(
+        name="Corelation Types",
+        options=["Pearson","Spearman"],
+        button_type="primary",
+        value="Spearman",
+        button_style="outline",
+    )
+
+    corr_strength = pn.widgets.RadioButtonGroup(
+        name="Strength Mode",
+        options=["Weakest","Strongest"],
+        button_type="primary",
+        value="Strongest",
+        button_style="outline",    
+    )
+
+    download_selector = pn.widgets.Select(
+        name="Files",
+        options=Settings.DOWNLOADS_FILES,    
+    )
+
+    download_click_bth = pn.widgets.Button(
+        name="Download",    
+        button_type="success"
+    )
+
+    export_format = pn.widgets.RadioButtonGroup(
+        name="Format",
+        options=Settings.EXPORT_FORMATS,
+        value=Settings.EXPORT_FORMATS[0],
+        button_type="primary",
+        button_style="outline",
+    )
+
+    export_compression = pn.widgets.RadioButtonGroup(
+        name="Compression",
+        options=Settings.EXPORT_COMPRESSIONS,
+        value=Settings.EXPORT_COMPRESSIONS[0],
+        button_type="primary",
+        button_style="outline",
+    )
+
+    # Filled in by download_callback with a link to the streaming export route
+    export_link = pn.pane.HTML()
+
+    return SimpleNamespace(
+        country_selector=country_selector,
+        cpi_selector=cpi_selector,
+        benchmark_selector=benchmark_selector,
+        date_slider=date_slider,
+        date_presets=date_presets,
+        change_mode=change_mode,
+        corr_type_selector=corr_type_selector,
+        corr_strength=corr_strength,
+        download_selector=download_selector,
+        download_click_bth=download_click_bth,
+        export_format=export_format,
+        export_compression=export_compression,
+        export_link=export_link,
+    )